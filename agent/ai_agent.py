@@ -4,17 +4,32 @@ AI Agent: Final Polish
 - Safe Browser Exit (обработка закрытия вкладки)
 """
 import asyncio
+import hashlib
 import json
+import time
 import uuid
 from typing import Callable, List, Dict, Any
-from google.genai import Client as GeminiClient, types
-from openai import AsyncOpenAI
 
 from .browser_controller import BrowserController
 from .page_analyzer import PageAnalyzer
-from .context_manager import ContextManager
+from .context_manager import ContextManager, estimate_tokens
+from .history import compact_history
+from .messages import EncodingCache
+from .llm_router import LLMRouter
+from .cassette import Cassette, CassetteMiss
+from .metrics import (TaskMetrics, LLM_LATENCY, LLM_PROMPT_TOKENS, LLM_CACHED_TOKENS, LLM_RESPONSE_TOKENS,
+                      TOOL_DURATION, SLEEP_DURATION, ITERATION_DURATION)
+from .journal import JOURNAL
+from .trajectory import TRAJECTORIES, RECORDED_TOOLS, FINGERPRINT_JS, FIND_BY_FINGERPRINT_JS, domain_of, element_id
 from .tools import TOOLS
-from config import GOOGLE_API_KEY, GOOGLE_MODEL, OPENAI_API_KEY, OPENAI_MODEL
+from .providers import sdk, genai_types
+from config import (GOOGLE_API_KEY, GOOGLE_MODEL, OPENAI_API_KEY, OPENAI_MODEL, LLM_STREAMING, MAX_PROMPT_TOKENS,
+                    GEMINI_CONTEXT_CACHE, GEMINI_CACHE_TTL, TRAJECTORY_REPLAY, LLM_CASSETTE_MODE, LLM_CASSETTE_DIR,
+                    LLM_CASSETTE_LATENCY, AUTO_SNAPSHOT, AUTO_SNAPSHOT_TOOLS, SUBAGENT_CONCURRENCY, SUBAGENT_MAX_STEPS,
+                    SUBAGENT_MAX_TASKS)
+
+# Инструменты, которые можно выполнять пачкой через run_actions
+BATCHABLE_TOOLS = ("navigate", "click", "type_text", "fill", "press_key", "scroll", "go_back", "wait", "hover", "get_page_content")
 
 SYSTEM_INSTRUCTION = """You are an autonomous browser agent.
 IMPORTANT RULES:
@@ -22,31 +37,170 @@ IMPORTANT RULES:
 2. THOUGHTS: Do NOT ask questions. State facts. 
    BAD: "Should I click?" 
    GOOD: "I see the button. I will click it."
-3. NAVIGATION: Use `get_page_content` to find element IDs.
-4. INPUT: Find the input ID -> `type_text` -> `press_key('Enter')`.
+3. NAVIGATION: Use `get_page_content` to find element IDs. Results of navigate/click/press_key may already include `page_content` (the page after the action) - use it instead of calling `get_page_content` again.
+4. INPUT: Find the input ID -> `type_text` -> `press_key('Enter')`. To fill several fields or do several known steps at once, use `run_actions`.
 5. COMPLETION: When the goal is achieved (e.g. item in cart), DO NOT just say "Done". You MUST call the `report_result` tool immediately to finish the task.
+6. PARALLEL: If the task splits into independent parts on different sites (e.g. compare prices on several marketplaces), use `spawn_agents` with one self-contained sub-task per site, then combine their results.
 """
 
+def reported_success(result: dict) -> bool:
+    """Флаг success из report_result (модель может прислать его строкой)"""
+    return str(result.get("success", True)).lower() not in ("false", "0", "no")
+
+
 class AIAgent:
     def __init__(self, browser: BrowserController, log_callback: Callable = None):
         self.browser = browser
         self.context = ContextManager()
         self.log = log_callback
         self.running = False
+        self.parent = None  # родительский агент подзадачи
         self.paused = False
+        self._llm_task = None
+        self._pending = []  # инструменты текущего хода
+        self.analyzer = None
+        self.iteration = 0
+        self.max_steps = 60
+        self.trajectories = TRAJECTORIES
+        self._trajectory = []  # шаги текущего прогона для записи траектории
+        self._replayed_steps = 0  # сколько из них повторено из сохраненной
+        self._start_domain = ""
+        self._task_started = 0.0
         
-        self.gemini = GeminiClient(api_key=GOOGLE_API_KEY, http_options={'timeout': 120.0})
-        self.openai = AsyncOpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
-        
-        self.tools_gemini = self._create_gemini_tools()
+        # Клиенты и SDK провайдеров создаются при первом запросе к модели
+        self._gemini = None
+        self._openai = None
+
+        # Схемы инструментов строятся один раз: префикс промпта (системный промпт,
+        # инструменты, сообщение задачи) байт в байт одинаков на всех итерациях,
+        # чтобы провайдеры могли переиспользовать его из кэша
+        self._tools_gemini = None
         self.tools_openai = self._create_openai_tools()
+        # Сообщения истории кодируются под провайдера один раз - дальше берутся из кэша
+        self._gemini_messages = EncodingCache(self._gemini_message)
+        self._openai_messages = EncodingCache(self._openai_message)
         self.provider = "gemini" 
+        providers = {"gemini": self._call_gemini}
+        if OPENAI_API_KEY: providers["openai"] = self._call_openai
+        if LLM_CASSETTE_MODE:
+            # Кассета подменяет сетевой вызов провайдера: запись или воспроизведение
+            salt = hashlib.sha256((SYSTEM_INSTRUCTION + json.dumps(TOOLS, ensure_ascii=False)).encode("utf-8")).hexdigest()
+            cassette = Cassette(LLM_CASSETTE_MODE, LLM_CASSETTE_DIR, LLM_CASSETTE_LATENCY, salt)
+            providers = {name: cassette.wrap(name, call) for name, call in providers.items()}
+        self.router = LLMRouter(providers, order=["gemini", "openai"])
+        self.router.observer = self._observe_llm
+        self.metrics = TaskMetrics()
+        self._gemini_cache = None  # (ключ префикса, имя cached content) | False - кэш недоступен
+        self.token_usage = {}
+        # Снимки после действий: приложено / сэкономлен ход модели / модель все равно запросила страницу
+        self.speculative = {"attached": 0, "saved": 0, "wasted": 0}
+        self._speculated = False
+        # Журнал: задача из очереди пишется под своим ID
+        self.task_id = None
+        self.run_id = None
+        self.result = None  # аргументы report_result последней задачи
+        self._llm_ms = None
+        self._tool_ms = {}
+        # Подзадачи: дочерние агенты сами подзадач не создают
+        self.can_spawn = True
+        self._children = set()
+        self._spawned = False
+        self._spawn_count = 0  # номера подзадач сквозные в пределах прогона
+
+    @property
+    def paused(self) -> bool:
+        # Пауза задачи действует и на ее подзадачи (как и stop)
+        return self._paused or bool(self.parent and self.parent.paused)
+
+    @paused.setter
+    def paused(self, value: bool):
+        self._paused = value
+
+    @property
+    def gemini(self):
+        if self._gemini is None:
+            self._gemini = sdk("gemini").Client(api_key=GOOGLE_API_KEY, http_options={'timeout': 120.0})
+        return self._gemini
+
+    @property
+    def openai(self):
+        if self._openai is None and OPENAI_API_KEY:
+            self._openai = sdk("openai").AsyncOpenAI(api_key=OPENAI_API_KEY)
+        return self._openai
+
+    @property
+    def tools_gemini(self):
+        if self._tools_gemini is None: self._tools_gemini = self._create_gemini_tools()
+        return self._tools_gemini
 
     async def execute_task(self, task: str):
+        try:
+            return await self._run_task(task)
+        finally:
+            await self._cancel_pending()
+            await self._finish_task()
+
+    async def _cancel_pending(self):
+        """Инструменты хода, запущенные стримингом, не должны пережить задачу: вкладка вернется в пул"""
+        pending, self._pending = self._pending, []
+        for fut in pending: fut.cancel()
+        if pending: await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _finish_task(self):
+        """Уборка после задачи: явный кэш Gemini, журнал и отчет по токенам"""
+        if self.result: status = "done" if reported_success(self.result) else "failed"
+        else: status = "stopped"
+        JOURNAL.finish_run(self.run_id, status, str((self.result or {}).get("result", "")))
+
+        if self._gemini_cache:
+            try: await self.gemini.aio.caches.delete(name=self._gemini_cache[1])
+            except Exception: pass
+        self._gemini_cache = None
+
+        for provider, u in self.token_usage.items():
+            uncached = u["prompt"] - u["cached"]
+            await self.log("system", f"📊 {provider}: {u['calls']} запросов, промпт {u['prompt']} ток. (из кэша {u['cached']}, без кэша {uncached}), ответ {u['output']} ток.")
+        if self.browser.fast_mode and self.browser.blocked["requests"]:
+            blocked = self.browser.blocked
+            await self.log("system", f"⚡ Быстрый режим: заблокировано {blocked['requests']} запросов, сэкономлено ~{blocked['bytes'] // 1024} КБ")
+        if self.speculative["attached"]:
+            spec = self.speculative
+            await self.log("system", f"🔮 Снимков после действий: {spec['attached']}, сэкономлено ходов модели: {spec['saved']}, лишних: {spec['wasted']}")
+        # Сводка по времени шагов задачи для панели/клиентов
+        await self.log("metrics", json.dumps(self.metrics.summary(), ensure_ascii=False))
+
+    def _observe_llm(self, provider: str, latency: float, ok: bool):
+        self.metrics.observe(LLM_LATENCY, latency, provider=provider, outcome="ok" if ok else "error")
+
+    async def _sleep(self, seconds: float, reason: str):
+        """Встроенная пауза агента, учитываемая в телеметрии"""
+        self.metrics.observe(SLEEP_DURATION, seconds, reason=reason)
+        await asyncio.sleep(seconds)
+
+    def _record_usage(self, usage: dict):
+        if not usage: return
+        provider = usage["provider"]
+        self.metrics.observe(LLM_PROMPT_TOKENS, usage.get("prompt") or 0, provider=provider)
+        self.metrics.observe(LLM_CACHED_TOKENS, usage.get("cached") or 0, provider=provider)
+        self.metrics.observe(LLM_RESPONSE_TOKENS, usage.get("output") or 0, provider=provider)
+        total = self.token_usage.setdefault(usage["provider"], {"calls": 0, "prompt": 0, "cached": 0, "output": 0})
+        total["calls"] += 1
+        for key in ("prompt", "cached", "output"):
+            total[key] += usage.get(key) or 0
+
+    async def _run_task(self, task: str):
         self.context.set_task(task)
+        self.token_usage = {}
+        self.metrics = TaskMetrics()
+        self.speculative = {"attached": 0, "saved": 0, "wasted": 0}
+        self._speculated = False
+        self.result = None
+        self._spawned = False
+        self._spawn_count = 0
+        self.run_id = self.task_id or uuid.uuid4().hex[:8]
+        JOURNAL.start_run(self.run_id, task)
         self.running = True
         self.paused = False
-        self.provider = "gemini"
 
         await self.log("system", f"🚀 Задача: {task}")
 
@@ -63,9 +217,33 @@ class AIAgent:
 
         history = [{"role": "user", "content": initial_msg}]
         last_thought = ""
+
+        # --- REPLAY: известный сценарий для этой задачи и домена повторяем без модели ---
+        self._trajectory = []
+        self._replayed_steps = 0
+        self._task_started = time.monotonic()
+        try: self._start_domain = domain_of(self.browser.page.url)
+        except Exception: self._start_domain = ""
+        known = self.trajectories.find(task, self._start_domain) if TRAJECTORY_REPLAY else None
+        if known:
+            completed, done, reason = await self._replay(known)
+            if not self.running: return
+            # Повторенные шаги остаются в траектории: перезаписываем ее, только если модель добавит свои
+            self._trajectory = list(known["steps"][:done])
+            self._replayed_steps = done
+            if completed:
+                # Ответ прошлого прогона мог устареть ("проверь статус") - итог по текущей странице дает модель
+                await self.log("system", "♻️ Сценарий повторен. Модель проверяет страницу и дает итог.")
+                history[0]["content"] += (f"\nNOTE: all {done} steps of a previously successful run were already replayed. "
+                                          f"Verify the current page and call report_result.")
+            else:
+                await self.log("system", f"♻️ Сценарий разошелся на шаге {done + 1}: {reason}. Продолжает модель.")
+                history[0]["content"] += (f"\nNOTE: {done} steps of a previously successful run were already replayed "
+                                          f"(last one diverged: {reason}). Continue from the current page state.")
         
         iteration = 0
-        while self.running and iteration < 60:
+        iteration_started = None
+        while self.running and iteration < self.max_steps:
             
             # --- SAFE EXIT: Проверка жизни браузера ---
             if not self.browser.page or self.browser.page.is_closed():
@@ -79,29 +257,62 @@ class AIAgent:
             if not self.running: break
 
             iteration += 1
-            history = self._trim_history(history)
+            self.iteration = iteration
+            if iteration_started: self.metrics.observe(ITERATION_DURATION, time.monotonic() - iteration_started)
+            iteration_started = time.monotonic()
+            history = self._compact_history(history)
+            # Дельты снимков опираются на последний полный снимок в истории
+            if self.analyzer and not any(m.get("snapshot") == "full" for m in history):
+                self.analyzer.reset()
+
+            # Стриминг: вызовы инструментов запускаются по мере разбора ответа
+            pending, dispatched = [], []
+            self._pending = pending
+            stream = {}
+            if LLM_STREAMING:
+                async def on_tool_call(tool):
+                    dispatched.append(tool)
+                    self._dispatch_tool(pending, tool)
+                stream = {"on_text": self._stream_thought, "on_tool_call": on_tool_call}
 
             try:
-                response = await self._call_llm_with_fallback(history)
+                # Запрос к модели идет отдельной задачей, чтобы stop() мог его прервать
+                llm_started = time.monotonic()
+                self._llm_task = asyncio.ensure_future(self._call_llm_with_fallback(history, **stream))
+                try:
+                    response = await self._llm_task
+                except asyncio.CancelledError:
+                    if self.running: raise
+                    break
+                finally:
+                    self._llm_task = None
+                    self._llm_ms = int((time.monotonic() - llm_started) * 1000)
                 if not response: 
-                    await asyncio.sleep(1)
+                    await self._sleep(1, "empty_response")
                     continue
+                self._record_usage(response.get("usage"))
 
                 content = response.get("content")
                 tool_calls = response.get("tool_calls", [])
 
+                # Приложенный к прошлому действию снимок сэкономил ход, если модель сразу действует
+                if self._speculated and tool_calls:
+                    self._speculated = False
+                    self.speculative["wasted" if tool_calls[0]["name"] == "get_page_content" else "saved"] += 1
+
                 if content:
                     clean_content = content.strip()
                     if clean_content and clean_content != last_thought:
-                        await self.log("thought", clean_content)
                         history.append({"role": "assistant", "content": clean_content})
                         last_thought = clean_content
-                        await asyncio.sleep(min(len(clean_content) * 0.05, 3.0))
+                        if not stream:
+                            await self.log("thought", clean_content)
+                            await self._sleep(min(len(clean_content) * 0.05, 3.0), "thought_display")
                         
                         # --- ЭВРИСТИКА ЗАВЕРШЕНИЯ ---
                         # Если агент говорит, что все сделал, но не вызывает инструмент
                         lower_content = clean_content.lower()
-                        if "успешно" in lower_content and ("добавлен" in lower_content or "выполнен" in lower_content):
+                        if not tool_calls and "успешно" in lower_content and ("добавлен" in lower_content or "выполнен" in lower_content):
                             # Добавляем подсказку от пользователя
                             history.append({"role": "user", "content": "Great! Call `report_result` now."})
                             continue
@@ -110,38 +321,11 @@ class AIAgent:
                     history.append({"role": "user", "content": "Proceed."})
                     continue
 
-                if tool_calls:
-                    msg = {"role": "assistant", "tool_calls": tool_calls}
-                    if content: msg["content"] = content
-                    if history[-1] != msg: history.append(msg)
-
-                for tool in tool_calls:
-                    while self.paused: await asyncio.sleep(0.5)
-                    if not self.running: break
-
-                    func_name = tool['name']
-                    args = tool['args']
-                    call_id = tool['id']
-
-                    await self.log("tool", f"🔧 {func_name}: {args}")
-
-                    # Вторичная проверка перед действием
-                    if not self.browser.page or self.browser.page.is_closed():
-                        await self.log("error", "Браузер закрыт.")
-                        self.running = False
-                        break
-
-                    result = await self._execute_tool(func_name, args)
-                    
-                    if func_name == "report_result":
-                        self.running = False
-                        await self.log("success", result.get('result', 'Готово'))
-                        return
-
-                    history.append({
-                        "role": "tool", "tool_call_id": call_id, "name": func_name,
-                        "content": json.dumps(result, ensure_ascii=False)
-                    })
+                # Без стриминга (или если адаптер не отдал вызов заранее) запускаем здесь
+                for tool in tool_calls[len(pending):]:
+                    self._dispatch_tool(pending, tool)
+                if await self._collect_tool_results(history, tool_calls, pending, content):
+                    return
 
             except Exception as e:
                 if not self.running: return
@@ -152,87 +336,277 @@ class AIAgent:
                     await self.log("error", "Браузер был закрыт.")
                     self.running = False
                     return
+                if isinstance(e, CassetteMiss):
+                    await self.log("error", f"Кассета: {error_msg}")
+                    self.running = False
+                    return
+
+                # Стрим оборвался, но часть инструментов уже выполнена - сохраняем их в историю
+                if dispatched and await self._collect_tool_results(history, dispatched, pending):
+                    return
 
                 print(f"Error: {e}")
-                await asyncio.sleep(2)
+                await self._sleep(2, "error_backoff")
+
+    async def _stream_thought(self, delta: str):
+        await self.log("thought_delta", delta)
+
+    def _dispatch_tool(self, pending: list, tool: dict):
+        """Запустить инструмент сразу, но строго после предыдущих вызовов этого хода"""
+        prev = pending[-1] if pending else None
+        pending.append(asyncio.ensure_future(self._run_tool_after(prev, tool)))
+
+    async def _run_tool_after(self, prev, tool: dict):
+        if prev is not None: await asyncio.wait([prev])
+        return await self._run_tool(tool)
+
+    async def _run_tool(self, tool: dict):
+        """Выполнить один вызов инструмента. None - вызов пропущен (стоп/браузер закрыт)"""
+        while self.paused and self.running: await asyncio.sleep(0.5)
+        if not self.running: return None
+
+        func_name = tool['name']
+        args = tool['args']
+
+        await self.log("tool", f"🔧 {func_name}: {args}")
+
+        # Вторичная проверка перед действием
+        if not self.browser.page or self.browser.page.is_closed():
+            await self.log("error", "Браузер закрыт.")
+            self.running = False
+            return None
+
+        started = time.monotonic()
+        result = await self._execute_tool(func_name, args)
+        self._tool_ms[tool["id"]] = int((time.monotonic() - started) * 1000)
+        if func_name == "report_result":
+            # Вызовы после report_result уже не выполняются
+            self.running = False
+        return result
+
+    async def _collect_tool_results(self, history, tool_calls, pending, content=None) -> bool:
+        """Дождаться инструментов хода и записать их в историю. True - задача завершена"""
+        results = await asyncio.gather(*pending)
+        # В историю попадают только выполненные вызовы - у каждого будет ответ tool
+        executed = [(tool, result) for tool, result in zip(tool_calls, results) if result is not None]
+        if not executed: return False
+        await self._attach_snapshot(*executed[-1])
+        msg = {"role": "assistant", "tool_calls": [tool for tool, _ in executed]}
+        if content: msg["content"] = content
+        if history[-1] != msg: history.append(msg)
+
+        url = self.browser.page.url if self.browser.page and not self.browser.page.is_closed() else ""
+        for tool, result in executed:
+            self.context.add_action(content or "", tool['name'], tool['args'], result, url)
+            self._journal_step(tool['name'], tool['args'], result, content, self._tool_ms.pop(tool['id'], None), url)
+            if tool['name'] == "report_result":
+                self.result = result
+                await self.log("success", result.get('result', 'Готово'))
+                # Итог подзадач в траекторию не попадает - такой прогон не повторяем
+                if reported_success(result) and len(self._trajectory) > self._replayed_steps and not self._spawned:
+                    self.trajectories.save(self.context.task, self._start_domain, self._trajectory,
+                                           time.monotonic() - self._task_started, str(result.get("result", "")))
+                return True
+            msg = {
+                "role": "tool", "tool_call_id": tool['id'], "name": tool['name'],
+                "content": json.dumps(result, ensure_ascii=False)
+            }
+            if result.get("snapshot"): msg["snapshot"] = result["snapshot"]
+            history.append(msg)
+        return False
+
+    def _journal_step(self, tool: str, args: dict, result: dict, thought: str = "", tool_ms: int = None, url: str = ""):
+        JOURNAL.step(self.run_id, {
+            "step": self.iteration, "thought": thought or "", "tool": tool, "args": args,
+            "success": result.get("success", True), "result_size": len(json.dumps(result, ensure_ascii=False, default=str)),
+            "llm_ms": self._llm_ms, "tool_ms": tool_ms, "settle_ms": result.get("settle_ms"), "url": url,
+        })
+
+    async def _attach_snapshot(self, tool: dict, result: dict):
+        """Снимок страницы после последнего действия хода - модель сразу видит его результат"""
+        if not AUTO_SNAPSHOT or not self.running or not result.get("success"): return
+        name = tool["name"]
+        if name == "run_actions" and result.get("results"): name = result["results"][-1].get("tool")
+        if name not in AUTO_SNAPSHOT_TOOLS: return
+        snapshot = await self._execute_tool("get_page_content", {})
+        if not snapshot.get("success"): return
+        result["page_content"] = snapshot["content"]
+        result["snapshot"] = snapshot["snapshot"]
+        self.speculative["attached"] += 1
+        self._speculated = True
+
+    def stop(self):
+        """Остановить задачу и прервать текущий запрос к модели"""
+        self.running = False
+        if self._llm_task and not self._llm_task.done():
+            self._llm_task.cancel()
+        for child in list(self._children): child.stop()
 
-    def _trim_history(self, history):
-        if len(history) > 12: return [history[0]] + history[-10:]
-        return history
+    def _compact_history(self, history):
+        """Уложить историю в бюджет промпта (за вычетом системного промпта и схем инструментов)"""
+        fixed = estimate_tokens(SYSTEM_INSTRUCTION) + estimate_tokens(json.dumps(TOOLS, ensure_ascii=False))
+        return compact_history(history, self.context.get_context_summary(), MAX_PROMPT_TOKENS - fixed)
 
-    async def _call_llm_with_fallback(self, history):
-        if self.provider == "openai" and self.openai:
-            return await self._call_openai(history)
+    async def _call_llm_with_fallback(self, history, on_text=None, on_tool_call=None):
         try:
-            return await self._call_gemini(history)
-        except Exception as e:
+            response = await self.router.call(history, on_text, on_tool_call)
+        except Exception:
             if not self.running: return {}
-            if self.openai:
-                self.provider = "openai"
-                return await self._call_openai(history)
-            raise e
+            raise
+        self.provider = self.router.last_provider
+        return response
 
     # --- ADAPTERS ---
-    async def _call_gemini(self, history):
-        gemini_hist = []
-        for msg in history:
-            parts = []
-            if msg.get('content'): parts.append(types.Part(text=str(msg['content'])))
-            if msg.get('tool_calls'):
-                for tc in msg['tool_calls']:
-                    parts.append(types.Part(function_call=types.FunctionCall(name=tc['name'], args=tc['args'])))
-            if msg.get('role') == 'tool':
-                parts.append(types.Part(function_response=types.FunctionResponse(name=msg.get('name', 'unknown'), response=json.loads(msg['content']))))
-            role = "model" if msg['role'] == "assistant" else "user"
-            if msg['role'] == 'tool': role = 'user'
-            gemini_hist.append(types.Content(role=role, parts=parts))
-
-        response = self.gemini.models.generate_content(
-            model=GOOGLE_MODEL, contents=gemini_hist,
-            config=types.GenerateContentConfig(system_instruction=SYSTEM_INSTRUCTION, tools=self.tools_gemini, temperature=0.5)
-        )
-        cand = response.candidates[0].content
-        content_txt = "".join([p.text for p in cand.parts if p.text])
+    @staticmethod
+    def _gemini_message(msg) -> "types.Content":
+        types = genai_types()
+        parts = []
+        if msg['role'] == 'tool':
+            parts.append(types.Part(function_response=types.FunctionResponse(name=msg.get('name', 'unknown'), response=json.loads(msg['content']))))
+        elif msg.get('content'):
+            parts.append(types.Part(text=str(msg['content'])))
+        for tc in msg.get('tool_calls') or []:
+            parts.append(types.Part(function_call=types.FunctionCall(name=tc['name'], args=tc['args'])))
+        return types.Content(role="model" if msg['role'] == "assistant" else "user", parts=parts)
+
+    async def _call_gemini(self, history, on_text=None, on_tool_call=None):
+        types = genai_types()
+        gemini_hist = self._gemini_messages.encode_history(history)
+
+        # Префикс из явного кэша: в запросе остается только хвост истории
+        cache_name = await self._gemini_cached_prefix(history[0], gemini_hist[0])
+        if cache_name:
+            config = types.GenerateContentConfig(cached_content=cache_name, temperature=0.5)
+            gemini_hist = gemini_hist[1:]
+        else:
+            config = types.GenerateContentConfig(system_instruction=SYSTEM_INSTRUCTION, tools=self.tools_gemini, temperature=0.5)
+
+        # Асинхронный клиент SDK: долгий ответ не блокирует event loop сервера
+        if on_text is None and on_tool_call is None:
+            response = await self.gemini.aio.models.generate_content(model=GOOGLE_MODEL, contents=gemini_hist, config=config)
+            result = self._parse_gemini_parts(response.candidates[0].content.parts)
+            result["usage"] = self._gemini_usage(response.usage_metadata)
+            return result
+
+        # Стриминг: вызовы функций приходят в чанках целиком - отдаем их сразу
+        content_txt, tool_calls, usage = [], [], None
+        stream = await self.gemini.aio.models.generate_content_stream(model=GOOGLE_MODEL, contents=gemini_hist, config=config)
+        async for chunk in stream:
+            if chunk.usage_metadata: usage = chunk.usage_metadata
+            if not chunk.candidates or not chunk.candidates[0].content: continue
+            parsed = self._parse_gemini_parts(chunk.candidates[0].content.parts or [])
+            if parsed["content"]:
+                content_txt.append(parsed["content"])
+                if on_text: await on_text(parsed["content"])
+            for tc in parsed["tool_calls"]:
+                tool_calls.append(tc)
+                if on_tool_call: await on_tool_call(tc)
+        return {"content": "".join(content_txt), "tool_calls": tool_calls, "usage": self._gemini_usage(usage)}
+
+    async def _gemini_cached_prefix(self, head: dict, head_content):
+        """
+        Явный кэш Gemini для стабильного префикса: системный промпт, инструменты
+        и сообщение задачи. Если кэш создать нельзя (например, префикс короче
+        минимума API), остаемся на неявном кэшировании по совпадающему префиксу.
+        """
+        if not GEMINI_CONTEXT_CACHE or self._gemini_cache is False: return None
+        key = hashlib.sha256(str(head.get("content")).encode("utf-8")).hexdigest()
+        if self._gemini_cache and self._gemini_cache[0] == key: return self._gemini_cache[1]
+        types = genai_types()
+        try:
+            cache = await self.gemini.aio.caches.create(model=GOOGLE_MODEL, config=types.CreateCachedContentConfig(
+                system_instruction=SYSTEM_INSTRUCTION, tools=self.tools_gemini, contents=[head_content], ttl=f"{GEMINI_CACHE_TTL}s"
+            ))
+        except Exception as e:
+            print(f"Gemini context cache disabled: {e}")
+            self._gemini_cache = False
+            return None
+        self._gemini_cache = (key, cache.name)
+        return cache.name
+
+    def _gemini_usage(self, meta) -> dict:
+        if not meta: return {}
+        return {"provider": "gemini", "prompt": meta.prompt_token_count or 0,
+                "cached": meta.cached_content_token_count or 0, "output": meta.candidates_token_count or 0}
+
+    def _parse_gemini_parts(self, parts):
+        content_txt = "".join([p.text for p in parts if p.text])
         tool_calls = []
-        for p in cand.parts:
+        for p in parts:
             if p.function_call:
-                tool_calls.append({"id": str(uuid.uuid4()), "name": p.function_call.name, "args": dict(p.function_call.args)})
+                tool_calls.append({"id": str(uuid.uuid4()), "name": p.function_call.name, "args": dict(p.function_call.args or {})})
         return {"content": content_txt, "tool_calls": tool_calls}
 
-    async def _call_openai(self, history):
-        messages = [{"role": "system", "content": SYSTEM_INSTRUCTION}] 
-        clean = []
-        pending = set()
-        for msg in history:
-            if msg['role'] == 'system': continue
-            if msg.get('tool_calls'):
-                for t in msg['tool_calls']: pending.add(t['id'])
-                clean.append(msg)
-            elif msg['role'] == 'tool':
-                if msg.get('tool_call_id') in pending: clean.append(msg)
-            else:
-                clean.append(msg)
-        
-        for msg in clean:
-            new_msg = {"role": msg["role"], "content": msg.get("content")}
-            if msg.get("tool_calls"):
-                new_msg["tool_calls"] = [{"id": tc["id"], "type": "function", "function": {"name": tc["name"], "arguments": json.dumps(tc["args"])}} for tc in msg["tool_calls"]]
-            if msg["role"] == "tool":
-                new_msg["tool_call_id"] = msg.get("tool_call_id")
-            messages.append(new_msg)
-
-        response = await self.openai.chat.completions.create(
-            model=OPENAI_MODEL, messages=messages, tools=self.tools_openai, tool_choice="auto"
+    @staticmethod
+    def _openai_message(msg) -> dict:
+        new_msg = {"role": msg["role"], "content": msg.get("content")}
+        if msg.get("tool_calls"):
+            new_msg["tool_calls"] = [{"id": tc["id"], "type": "function", "function": {"name": tc["name"], "arguments": json.dumps(tc["args"])}} for tc in msg["tool_calls"]]
+        if msg["role"] == "tool":
+            new_msg["tool_call_id"] = msg.get("tool_call_id")
+        return new_msg
+
+    async def _call_openai(self, history, on_text=None, on_tool_call=None):
+        # Пары tool_calls/tool гарантирует compact_history - фильтровать сироты не нужно
+        messages = [{"role": "system", "content": SYSTEM_INSTRUCTION}]
+        messages += self._openai_messages.encode_history([m for m in history if m['role'] != 'system'])
+
+        if on_text is None and on_tool_call is None:
+            response = await self.openai.chat.completions.create(
+                model=OPENAI_MODEL, messages=messages, tools=self.tools_openai, tool_choice="auto"
+            )
+            res_msg = response.choices[0].message
+            tool_calls = []
+            if res_msg.tool_calls:
+                for tc in res_msg.tool_calls:
+                    tool_calls.append({"id": tc.id, "name": tc.function.name, "args": json.loads(tc.function.arguments)})
+            return {"content": res_msg.content, "tool_calls": tool_calls, "usage": self._openai_usage(response.usage)}
+
+        # Кэширование префикса у OpenAI автоматическое - важно лишь не менять его между запросами
+        stream = await self.openai.chat.completions.create(
+            model=OPENAI_MODEL, messages=messages, tools=self.tools_openai, tool_choice="auto", stream=True,
+            stream_options={"include_usage": True}
         )
-        res_msg = response.choices[0].message
-        tool_calls = []
-        if res_msg.tool_calls:
-            for tc in res_msg.tool_calls:
-                tool_calls.append({"id": tc.id, "name": tc.function.name, "args": json.loads(tc.function.arguments)})
-        return {"content": res_msg.content, "tool_calls": tool_calls}
+        content_txt, tool_calls, usage = [], [], None
+        partial = {}  # index -> собираемый по кусочкам вызов
+
+        async def flush(upto=None):
+            # Вызов считается полным, когда начался следующий или стрим закончился
+            for idx in sorted(partial):
+                if upto is not None and idx >= upto: break
+                tc = partial.pop(idx)
+                call = {"id": tc["id"], "name": tc["name"], "args": json.loads(tc["arguments"] or "{}")}
+                tool_calls.append(call)
+                if on_tool_call: await on_tool_call(call)
+
+        async for chunk in stream:
+            if chunk.usage: usage = chunk.usage
+            if not chunk.choices: continue
+            choice = chunk.choices[0]
+            delta = choice.delta
+            if delta and delta.content:
+                content_txt.append(delta.content)
+                if on_text: await on_text(delta.content)
+            for tcd in (delta.tool_calls if delta else None) or []:
+                if tcd.index not in partial:
+                    await flush(upto=tcd.index)
+                    partial[tcd.index] = {"id": tcd.id, "name": "", "arguments": ""}
+                if tcd.function:
+                    if tcd.function.name: partial[tcd.index]["name"] += tcd.function.name
+                    if tcd.function.arguments: partial[tcd.index]["arguments"] += tcd.function.arguments
+            if choice.finish_reason: await flush()
+        await flush()
+        return {"content": "".join(content_txt) or None, "tool_calls": tool_calls, "usage": self._openai_usage(usage)}
+
+    def _openai_usage(self, usage) -> dict:
+        if not usage: return {}
+        details = getattr(usage, "prompt_tokens_details", None)
+        return {"provider": "openai", "prompt": usage.prompt_tokens or 0,
+                "cached": (getattr(details, "cached_tokens", 0) or 0) if details else 0, "output": usage.completion_tokens or 0}
 
     # --- TOOLS SETUP ---
     def _create_gemini_tools(self):
+        types = genai_types()
         tools = []
         for t in TOOLS:
             props = {k: types.Schema(type=types.Type.STRING) for k in t["parameters"]["properties"]}
@@ -244,6 +618,75 @@ class AIAgent:
 
     # --- EXECUTION ---
     async def _execute_tool(self, tool_name: str, params: dict) -> dict:
+        """Выполнить инструмент с замером времени; ожидание стабилизации страницы учитывается отдельно"""
+        started = time.monotonic()
+        result = await self._record_tool(tool_name, params)
+        self.metrics.observe(TOOL_DURATION, time.monotonic() - started, tool=tool_name)
+        if result.get("settle_ms") is not None:
+            self.metrics.observe(SLEEP_DURATION, result["settle_ms"] / 1000, reason="settle")
+        return result
+
+    async def _record_tool(self, tool_name: str, params: dict) -> dict:
+        """Успешные действия со страницей пишутся в траекторию"""
+        if tool_name not in RECORDED_TOOLS:
+            return await self._call_tool(tool_name, params)
+
+        fingerprint = None
+        el_id = element_id(params)
+        if el_id:
+            try: fingerprint = await self.browser.page.evaluate(FINGERPRINT_JS, el_id)
+            except Exception: pass
+        result = await self._call_tool(tool_name, params)
+        if result.get("success"):
+            self._trajectory.append({
+                "tool": tool_name, "args": params, "fingerprint": fingerprint,
+                "domain": domain_of(self.browser.page.url),
+            })
+        return result
+
+    async def _replay(self, trajectory: dict):
+        """
+        Повторить записанную траекторию. Каждый шаг сверяется со страницей:
+        элемент ищется по отпечатку, после шага проверяется домен.
+        Возвращает (завершена ли, сколько шагов выполнено, причина расхождения).
+        """
+        steps = trajectory["steps"]
+        started = time.monotonic()
+        await self.log("system", f"♻️ Повторяю известный сценарий без модели ({len(steps)} шагов)")
+
+        for i, step in enumerate(steps):
+            if not self.running: return False, i, "stopped"
+            args = dict(step["args"])
+            if step.get("fingerprint"):
+                try:
+                    found = await self.browser.page.evaluate(FIND_BY_FINGERPRINT_JS, step["fingerprint"])
+                except Exception as e:
+                    # Контекст уничтожен навигацией после прошлого шага и т.п. - дальше ведет модель
+                    self.trajectories.record_replay(False)
+                    return False, i, f"element lookup failed: {e}"
+                if not found:
+                    self.trajectories.record_replay(False)
+                    return False, i, f"element {step['fingerprint'].get('tag')} \"{step['fingerprint'].get('text', '')[:40]}\" not found"
+                args["selector"] = f"[{found}]"
+
+            await self.log("tool", f"♻️ {step['tool']}: {args}")
+            step_started = time.monotonic()
+            result = await self._execute_tool(step["tool"], args)
+            self._journal_step(step["tool"], args, result, "replay", int((time.monotonic() - step_started) * 1000), self.browser.page.url)
+            if not result.get("success"):
+                self.trajectories.record_replay(False)
+                return False, i, result.get("error", "step failed")
+            if step.get("domain") and domain_of(self.browser.page.url) != step["domain"]:
+                self.trajectories.record_replay(False)
+                return False, i + 1, f"landed on {domain_of(self.browser.page.url)} instead of {step['domain']}"
+
+        saved = trajectory.get("duration", 0) - (time.monotonic() - started)
+        self.trajectories.record_replay(True, saved)
+        stats = self.trajectories.stats()
+        await self.log("system", f"♻️ Сценарий повторен, сэкономлено ~{saved:.0f} с (попаданий {stats['hit_rate']:.0%}, всего сэкономлено {stats['time_saved']:.0f} с)")
+        return True, len(steps), ""
+
+    async def _call_tool(self, tool_name: str, params: dict) -> dict:
         try:
             # Проверка перед выполнением
             if not self.browser.page or self.browser.page.is_closed():
@@ -257,15 +700,136 @@ class AIAgent:
             elif tool_name == "scroll": return await self.browser.scroll(params.get("direction", "down"))
             elif tool_name == "get_page_content":
                 if not self.browser.page: return {"success": False, "error": "No browser"}
-                analyzer = PageAnalyzer(self.browser.page)
-                return {"success": True, "content": await analyzer.get_compact_state()}
+                # Анализатор живет между вызовами: помнит прошлый снимок для дельт
+                if not self.analyzer or self.analyzer.page is not self.browser.page:
+                    self.analyzer = PageAnalyzer(self.browser.page, metrics=self.metrics)
+                self.analyzer.metrics = self.metrics
+                if params.get("expand"): return self.analyzer.expand_fold(str(params["expand"]))
+                full = str(params.get("full", "")).lower() in ("true", "1", "yes")
+                budget = int(float(params["max_tokens"])) if params.get("max_tokens") else None
+                snapshot = await self.analyzer.get_snapshot(step=self.iteration, full=full, budget=budget, task=self.context.task)
+                return {"success": True, **snapshot}
             elif tool_name == "go_back": return await self.browser.go_back()
             elif tool_name == "wait": return await self.browser.wait(min(float(params.get("seconds", 1)), 10))
             elif tool_name == "hover": return await self.browser.hover(params.get("selector", ""))
+            elif tool_name == "run_actions": return await self._run_actions(params.get("actions", []))
+            elif tool_name == "spawn_agents": return await self._spawn_agents(params.get("tasks", []), params.get("max_steps"))
             elif tool_name == "ask_user": return {"success": True, "error": "Input not supported"}
             elif tool_name == "request_confirmation": return {"success": True, "approved": True}
-            elif tool_name == "save_finding": return {"success": True}
+            elif tool_name == "save_finding":
+                self.context.add_finding(str(params.get("finding", "")))
+                return {"success": True}
             elif tool_name == "report_result": return {"success": params.get("success", True), "result": params.get("result", "")}
             return {"success": False, "error": f"Unknown tool: {tool_name}"}
         except Exception as e:
-            return {"success": False, "error": str(e)}
\ No newline at end of file
+            return {"success": False, "error": str(e)}
+
+    async def _run_actions(self, actions) -> dict:
+        """Выполнить последовательность действий за один ход модели; стоп на первой ошибке"""
+        if isinstance(actions, str):
+            try: actions = json.loads(actions)
+            except ValueError as e: return {"success": False, "error": f"actions is not valid JSON: {e}"}
+        if not isinstance(actions, list) or not actions:
+            return {"success": False, "error": "actions must be a non-empty list"}
+
+        results = []
+        for step in actions:
+            name = step.get("tool") if isinstance(step, dict) else None
+            args = step.get("args") or {} if isinstance(step, dict) else {}
+            if name not in BATCHABLE_TOOLS:
+                results.append({"tool": name, "success": False, "error": f"Tool not allowed in run_actions: {name}"})
+                break
+            if not self.running: break
+
+            await self.log("tool", f"🔧 {name}: {args}")
+            result = await self._execute_tool(name, args)
+            results.append({"tool": name, **result})
+            if not result.get("success", False): break
+
+        ok = len(results) == len(actions) and all(r.get("success", False) for r in results)
+        return {"success": ok, "completed": sum(1 for r in results if r.get("success")), "total": len(actions), "results": results}
+
+    # --- SUB-AGENTS ---
+    async def _spawn_agents(self, tasks, max_steps=None) -> dict:
+        """Независимые подзадачи параллельно: у каждой свой агент, своя вкладка и свой бюджет шагов"""
+        if not self.can_spawn: return {"success": False, "error": "Sub-agents cannot spawn sub-agents"}
+        if isinstance(tasks, str):
+            try: tasks = json.loads(tasks)
+            except ValueError as e: return {"success": False, "error": f"tasks is not valid JSON: {e}"}
+        if not isinstance(tasks, list) or not tasks:
+            return {"success": False, "error": "tasks must be a non-empty list"}
+        if len(tasks) > SUBAGENT_MAX_TASKS:
+            return {"success": False, "error": f"Too many sub-tasks: {len(tasks)} (max {SUBAGENT_MAX_TASKS})"}
+
+        default_steps = int(float(max_steps)) if max_steps else SUBAGENT_MAX_STEPS
+        specs = []
+        for item in tasks:
+            text, steps = (item.get("task"), item.get("max_steps")) if isinstance(item, dict) else (item, None)
+            if not text: return {"success": False, "error": f"Empty sub-task: {item}"}
+            specs.append((str(text), max(1, min(int(float(steps or default_steps)), self.max_steps))))
+
+        self._spawned = True
+        slots = asyncio.Semaphore(SUBAGENT_CONCURRENCY)
+        started = time.monotonic()
+        await self.log("system", f"🔀 Подзадач: {len(specs)}, одновременно до {SUBAGENT_CONCURRENCY}")
+        first = self._spawn_count + 1
+        self._spawn_count += len(specs)
+        results = await asyncio.gather(*(self._run_subagent(n, text, steps, slots) for n, (text, steps) in enumerate(specs, first)))
+        ok = sum(1 for r in results if r["success"])
+        return {"success": ok == len(results), "completed": ok, "total": len(results),
+                "duration_ms": int((time.monotonic() - started) * 1000), "results": results}
+
+    async def _run_subagent(self, n: int, task: str, max_steps: int, slots: asyncio.Semaphore) -> dict:
+        child, error = None, ""
+        started = time.monotonic()
+        async with slots:
+            if not self.running: return {"task": task, "success": False, "result": "Stopped", "steps": 0}
+            tab = None
+            try:
+                tab = await self.browser.open_tab()
+                child = self._make_subagent(tab, self._subagent_log(n))
+                child.can_spawn = False
+                child.parent = self
+                child.max_steps = max_steps
+                child.task_id = f"{self.run_id}.{n}"  # в журнале подзадача видна рядом с родителем
+                self._children.add(child)
+                await child.execute_task(task)
+            except Exception as e:
+                error = str(e)
+                await self.log("system", f"[{n}] ❌ Ошибка подзадачи: {e}")
+            finally:
+                if child: self._children.discard(child)
+                if tab:
+                    try: await tab.close_tab()
+                    except Exception: pass
+
+        steps = child.iteration if child else 0
+        result = (child and child.result) or {
+            "success": False, "result": error or ("Step budget exhausted" if steps >= max_steps else "Stopped")}
+        return {"task": task, "success": reported_success(result), "result": str(result.get("result", "")),
+                "steps": steps, "duration_ms": int((time.monotonic() - started) * 1000)}
+
+    def _make_subagent(self, browser: BrowserController, log_callback: Callable) -> "AIAgent":
+        return type(self)(browser, log_callback=log_callback)
+
+    def _subagent_log(self, n: int) -> Callable:
+        """
+        События дочернего агента идут в ленту родителя с номером подзадачи.
+        Стриминг мысли собирается в целую мысль, чтобы куски параллельных агентов
+        не перемешались; итог и ошибки идут как системные - панель не должна
+        считать по ним завершенной всю задачу.
+        """
+        parts = []
+
+        async def log(type: str, message: str):
+            if type == "thought_delta":
+                parts.append(message)
+                return
+            if parts:
+                await self.log("thought", f"[{n}] {''.join(parts)}")
+                parts.clear()
+            if type == "metrics": return
+            if type == "success": type, message = "system", f"✅ {message}"
+            elif type == "error": type, message = "system", f"❌ {message}"
+            await self.log(type, f"[{n}] {message}")
+        return log
@@ -0,0 +1,165 @@
+"""
+Снимок страницы по дереву доступности Chromium (CDP).
+Вместо большого page.evaluate дерево берется из Accessibility.getFullAXTree:
+роли и имена уже посчитаны браузером, скрытые узлы помечены ignored.
+Геометрия (окно видимости) - через DOM.getBoxModel только для выводимых
+узлов. ID элемента - backendNodeId: он стабилен, пока жив документ,
+и проставляется в data-r-id, чтобы click/type_text находили элемент.
+Формат строк совпадает с JS-движками.
+"""
+import asyncio
+import re
+from typing import List, Optional
+
+from playwright.async_api import Page
+
+MAX_TEXT_LEN = 100
+MAX_DEPTH = 20
+WIN_ABOVE = 200   # как в JS-движках: окно видимости от -200 до innerHeight + 800
+WIN_BELOW = 800
+
+INTERACTIVE_ROLES = {
+    "link", "button", "textbox", "searchbox", "combobox", "listbox", "checkbox", "radio", "slider",
+    "spinbutton", "switch", "menuitem", "menuitemcheckbox", "menuitemradio", "tab", "option", "treeitem",
+}
+# Роли полей ввода: имя узла - это подпись, а текст - значение
+INPUT_ROLES = {"textbox", "searchbox", "combobox", "listbox", "spinbutton", "slider", "checkbox", "radio", "switch"}
+# Роль -> тег в строке снимка (по тегу строки ранжируются при урезании)
+ROLE_TAGS = {
+    "link": "a", "button": "button", "textbox": "input", "searchbox": "input", "combobox": "select",
+    "listbox": "select", "checkbox": "input", "radio": "input", "slider": "input", "spinbutton": "input",
+    "switch": "input", "menuitem": "button", "tab": "button", "option": "option", "image": "img", "img": "img",
+    "heading": "h", "paragraph": "p", "StaticText": "text", "cell": "td", "row": "tr",
+}
+# Служебные узлы без собственного смысла: не выводятся, их дети поднимаются на уровень выше
+SKIP_ROLES = {"RootWebArea", "InlineTextBox", "LineBreak", "generic", "none", "presentation"}
+
+SPACE_RE = re.compile(r"\s+")
+
+
+def clean(text) -> str:
+    return SPACE_RE.sub(" ", str(text or "")).strip()[:MAX_TEXT_LEN]
+
+
+def prop(node: dict, key: str):
+    value = node.get(key) or {}
+    return value.get("value") if isinstance(value, dict) else None
+
+
+def flag(node: dict, name: str) -> bool:
+    for p in node.get("properties") or []:
+        if p.get("name") == name: return str((p.get("value") or {}).get("value")).lower() == "true"
+    return False
+
+
+class AXSnapshot:
+    """Движок снимков "ax": одна CDP-сессия на вкладку"""
+
+    def __init__(self, page: Page):
+        self.page = page
+        self._session = None
+        self._doc = None        # backendNodeId корня: меняется с каждым новым документом
+        self._tagged = set()    # узлы документа, которым уже проставлен data-r-id
+
+    async def _cdp(self):
+        if self._session is None:
+            self._session = await self.page.context.new_cdp_session(self.page)
+            await self._session.send("DOM.enable")
+            await self._session.send("Accessibility.enable")
+        return self._session
+
+    async def snapshot(self) -> str:
+        cdp = await self._cdp()
+        nodes = (await cdp.send("Accessibility.getFullAXTree"))["nodes"]
+        metrics = await cdp.send("Page.getLayoutMetrics")
+        viewport = metrics.get("cssLayoutViewport") or metrics["layoutViewport"]
+        if not nodes: return "Page seems empty (Scripts loading?). Wait..."
+
+        by_id = {n["nodeId"]: n for n in nodes}
+        root = nodes[0]
+        if root.get("backendDOMNodeId") != self._doc:
+            self._doc, self._tagged = root.get("backendDOMNodeId"), set()
+
+        # 1. Какие узлы выводить (без учета геометрии)
+        printed: List[tuple] = []  # (node, depth)
+        stack = [(root, 0, "")]  # обход в глубину без рекурсии: AX-деревья бывают очень глубокими
+        while stack:
+            node, depth, covered = stack.pop()
+            role = prop(node, "role")
+            shown = False
+            if not node.get("ignored") and role not in SKIP_ROLES:
+                name = clean(prop(node, "name"))
+                if role == "StaticText":
+                    # Текст, уже вошедший в имя ссылки/кнопки/заголовка, не дублируем
+                    shown = len(name) > 1 and name not in covered
+                else:
+                    shown = role in INTERACTIVE_ROLES or len(name) > 1
+                if shown:
+                    printed.append((node, min(depth, MAX_DEPTH)))
+                    covered = name or covered
+            children = [by_id[c] for c in node.get("childIds") or [] if c in by_id]
+            for child in reversed(children):
+                stack.append((child, depth + 1 if shown else depth, covered))
+
+        # 2. Геометрия: текстовый узел видим, если виден его родительский элемент
+        def box_node(node) -> Optional[int]:
+            if prop(node, "role") != "StaticText": return node.get("backendDOMNodeId")
+            parent = by_id.get(node.get("parentId"))
+            return parent.get("backendDOMNodeId") if parent else None
+
+        backend_ids = {box_node(n) for n, _ in printed} - {None}
+        visible = await self._visible(cdp, backend_ids, viewport["clientHeight"])
+
+        # 3. Строки снимка; интерактивным узлам - ID = backendNodeId
+        lines, to_tag = [], []
+        for node, depth in printed:
+            if box_node(node) not in visible: continue
+            role = prop(node, "role")
+            tag = ROLE_TAGS.get(role, str(role).lower())
+            name = clean(prop(node, "name"))
+            line = "  " * depth
+            if role in INTERACTIVE_ROLES:
+                backend_id = node["backendDOMNodeId"]
+                line += f"[{backend_id}] <{tag}>"
+                if backend_id not in self._tagged: to_tag.append(backend_id)
+                if role in INPUT_ROLES:
+                    value = clean(prop(node, "value"))
+                    if value: line += f' "{value}"'
+                    if name: line += f" [Label: {name}]"
+                    if flag(node, "checked"): line += " [checked]"
+                elif name:
+                    line += f' "{name}"'
+            elif tag == "img":
+                line += f"<img> [Img: {name}]"
+            else:
+                line += f'<{tag}> "{name}"'
+            lines.append(line)
+
+        await self._tag(cdp, to_tag)
+        if not lines: return "Page seems empty (Scripts loading?). Wait..."
+        return f"URL: {self.page.url}\nSCROLL: {int(viewport.get('pageY', 0))}\n\n" + "\n".join(lines) + "\n"
+
+    async def _visible(self, cdp, backend_ids, viewport_h: float) -> set:
+        """Узлы с ненулевой рамкой в окне видимости (как isVisible в JS-движках)"""
+        ids = list(backend_ids)
+        boxes = await asyncio.gather(*(cdp.send("DOM.getBoxModel", {"backendNodeId": i}) for i in ids),
+                                     return_exceptions=True)
+        visible = set()
+        for backend_id, box in zip(ids, boxes):
+            if isinstance(box, Exception): continue  # не отрисован (display: none и т.п.)
+            quad = box["model"]["border"]
+            xs, ys = quad[0::2], quad[1::2]
+            if max(xs) - min(xs) < 1 or max(ys) - min(ys) < 1: continue
+            if max(ys) < -WIN_ABOVE or min(ys) > viewport_h + WIN_BELOW: continue
+            visible.add(backend_id)
+        return visible
+
+    async def _tag(self, cdp, backend_ids: List[int]):
+        """Проставить data-r-id новым интерактивным узлам"""
+        if not backend_ids: return
+        await cdp.send("DOM.getDocument", {"depth": 0})
+        pushed = await cdp.send("DOM.pushNodesByBackendIdsToFrontend", {"backendNodeIds": backend_ids})
+        calls = [cdp.send("DOM.setAttributeValue", {"nodeId": node_id, "name": "data-r-id", "value": str(backend_id)})
+                 for backend_id, node_id in zip(backend_ids, pushed["nodeIds"]) if node_id]
+        await asyncio.gather(*calls, return_exceptions=True)
+        self._tagged.update(backend_ids)
@@ -3,30 +3,226 @@
 Имитирует физические нажатия клавиш для обхода защиты React/Vue.
 """
 import asyncio
+import base64
 import os
+import re
+import time
+from urllib.parse import urlparse
 from playwright.async_api import async_playwright, Page, BrowserContext
+from config import SETTLE_MAX_WAIT, SETTLE_DOM_QUIET_MS, SETTLE_NETWORK_QUIET_MS, SETTLE_MAX_INFLIGHT, MAX_CONCURRENT_TASKS, TYPE_DELAY_MS
+from config import SETTLE_DOM_MAX_MUTATIONS
+from config import FAST_BLOCKED_TYPES, FAST_BLOCKED_DOMAINS
+
+# Ждет, пока DOM успокоится: за окно quiet мс не больше maxMutations изменений
+# (но не дольше limit мс). Смена style/class не считается, а фоновая мелочь
+# (таймеры, карусели, тикеры цен) укладывается в допуск и не держит до limit
+DOM_QUIET_JS = """([quiet, limit, maxMutations]) => new Promise(resolve => {
+    let count = 0;
+    const obs = new MutationObserver(records => {
+        for (const r of records) {
+            if (r.type === 'attributes' && (r.attributeName === 'style' || r.attributeName === 'class')) continue;
+            count++;
+        }
+    });
+    const tick = setInterval(() => { if (count <= maxMutations) done(); count = 0; }, quiet);
+    const hard = setTimeout(done, limit);
+    function done() { obs.disconnect(); clearInterval(tick); clearTimeout(hard); resolve(true); }
+    obs.observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+})"""
+
+# После fill сообщаем фреймворку об изменении так же, как при ручном вводе
+FIRE_INPUT_EVENTS_JS = """el => {
+    el.dispatchEvent(new Event('input', {bubbles: true}));
+    el.dispatchEvent(new Event('change', {bubbles: true}));
+}"""
+
+READ_VALUE_JS = "el => el.isContentEditable ? el.innerText : el.value"
+
+# Долгоживущие соединения никогда не "завершаются" - в учете сети их не считаем
+IGNORED_RESOURCE_TYPES = ("websocket", "eventsource")
+
+# Быстрый режим: картинки подменяются прозрачным GIF 1x1, чтобы <img> (и его alt)
+# остались в разметке и в снимке страницы; остальное блокируется
+BLANK_GIF = base64.b64decode("R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7")
+# Средний размер заблокированного ответа по типу - для оценки сэкономленного трафика
+ESTIMATED_BYTES = {"image": 60_000, "media": 500_000, "font": 40_000, "script": 30_000}
+DEFAULT_ESTIMATED_BYTES = 10_000
+# Перехват идет только по URL блокируемых доменов и расширений этих типов: остальные
+# запросы (документы, скрипты, XHR) не проходят через Python. Тип ресурса по URL не
+# узнать, поэтому обработчик все равно сверяет его (_is_blocked)
+BLOCKED_EXTENSIONS = {
+    "image": ("png", "jpe?g", "gif", "webp", "avif", "svg", "ico", "bmp"),
+    "font": ("woff2?", "ttf", "otf", "eot"),
+    "media": ("mp4", "webm", "m4[av]", "mp3", "ogg", "wav", "m3u8", "ts"),
+}
+FAST_ROUTE_RE = re.compile(
+    r"^[a-z]+://(?:[^/?#]*\.)?(?:" + "|".join(re.escape(d) for d in FAST_BLOCKED_DOMAINS) + r")(?::\d+)?(?:[/?#]|$)"
+    r"|\.(?:" + "|".join(ext for t in FAST_BLOCKED_TYPES for ext in BLOCKED_EXTENSIONS.get(t, ())) + r")(?:[?#]|$)",
+    re.IGNORECASE)
 
 class BrowserController:
     # ... (init, start, stop, navigate без изменений) ...
-    def __init__(self, user_data_dir: str, headless: bool = False, viewport: dict = None):
+    def __init__(self, user_data_dir: str, headless: bool = False, viewport: dict = None, pool_size: int = MAX_CONCURRENT_TASKS):
         self.user_data_dir = user_data_dir
         self.headless = headless
         self.viewport = viewport
+        self.pool_size = pool_size
         self.playwright = None
         self.context = None
         self.page = None
+        # Пул вкладок для параллельных задач: каждая вкладка - свой BrowserController,
+        # разделяющий контекст (и сессии) с владельцем. Первая вкладка - сам владелец
+        self._tabs = []
+        self._idle_tabs = asyncio.Queue()
+        self._tabs_lock = asyncio.Lock()
+        # Состояние для детектора "страница успокоилась"
+        self._inflight = set()
+        self._last_network = 0.0
+        self._last_navigation = 0.0
+        # Быстрый режим (блокировка ресурсов) и его счетчики за текущую задачу
+        self.fast_mode = False
+        self.blocked = {"requests": 0, "bytes": 0}
 
     async def start(self):
         if not os.path.exists(self.user_data_dir): os.makedirs(self.user_data_dir)
         extension_path = os.path.abspath("./extension")
         self.playwright = await async_playwright().start()
         args = [f"--disable-extensions-except={extension_path}", f"--load-extension={extension_path}", "--start-maximized", "--disable-blink-features=AutomationControlled"]
-        self.context = await self.playwright.chromium.launch_persistent_context(self.user_data_dir, headless=False, args=args, viewport=None, locale='ru-RU', ignore_https_errors=True)
+        self.context = await self.playwright.chromium.launch_persistent_context(self.user_data_dir, headless=self.headless, args=args, viewport=None, locale='ru-RU', ignore_https_errors=True)
         if self.context.pages: self.page = self.context.pages[0]
         else: self.page = await self.context.new_page()
         self.page.set_default_timeout(10000)
+        self._watch_page(self.page)
+        self._tabs = [self]
+        self._idle_tabs.put_nowait(self)
         return self
 
+    # --- TAB POOL ---
+    async def _open_tab(self) -> "BrowserController":
+        page = await self.context.new_page()
+        page.set_default_timeout(10000)
+        tab = BrowserController(self.user_data_dir, self.headless, self.viewport, pool_size=0)
+        tab.playwright, tab.context, tab.page = self.playwright, self.context, page
+        tab._watch_page(page)
+        return tab
+
+    async def acquire_tab(self) -> "BrowserController":
+        """Взять свободную вкладку из пула (или открыть новую, пока не достигнут лимит)"""
+        while True:
+            async with self._tabs_lock:
+                while not self._idle_tabs.empty():
+                    tab = self._idle_tabs.get_nowait()
+                    if tab and tab.page and not tab.page.is_closed(): return tab
+                    if tab in self._tabs: self._tabs.remove(tab)
+                if len(self._tabs) < self.pool_size:
+                    tab = await self._open_tab()
+                    self._tabs.append(tab)
+                    return tab
+            # Все вкладки заняты - ждем, пока какую-нибудь вернут, и пробуем снова
+            self._idle_tabs.put_nowait(await self._idle_tabs.get())
+
+    def release_tab(self, tab: "BrowserController"):
+        """Вернуть вкладку в пул. Закрытые пользователем вкладки выбывают из пула"""
+        if tab.page and not tab.page.is_closed():
+            self._idle_tabs.put_nowait(tab)
+        else:
+            if tab in self._tabs: self._tabs.remove(tab)
+            # Будим ожидающих: освободилось место под новую вкладку
+            self._idle_tabs.put_nowait(None)
+
+    async def open_tab(self) -> "BrowserController":
+        """Отдельная вкладка вне пула (для подзадач): тот же контекст и тот же быстрый режим"""
+        tab = await self._open_tab()
+        await tab.set_fast_mode(self.fast_mode)
+        return tab
+
+    async def close_tab(self):
+        """Закрыть вкладку, открытую open_tab"""
+        if self.page and not self.page.is_closed(): await self.page.close()
+
+    # --- FAST MODE ---
+    async def set_fast_mode(self, enabled: bool):
+        """Включить/выключить блокировку ресурсов на вкладке; счетчики начинаются заново"""
+        self.blocked = {"requests": 0, "bytes": 0}
+        if enabled == self.fast_mode or not self.page: return
+        if enabled: await self.page.route(FAST_ROUTE_RE, self._route_request)
+        else: await self.page.unroute(FAST_ROUTE_RE, self._route_request)
+        self.fast_mode = enabled
+
+    @staticmethod
+    def _is_blocked(request) -> bool:
+        # Сами страницы не трогаем, даже на домене из списка
+        if request.resource_type == "document": return False
+        if request.resource_type in FAST_BLOCKED_TYPES: return True
+        host = urlparse(request.url).hostname or ""
+        return any(host == d or host.endswith("." + d) for d in FAST_BLOCKED_DOMAINS)
+
+    async def _route_request(self, route):
+        request = route.request
+        try:
+            if not self._is_blocked(request): return await route.continue_()
+            self.blocked["requests"] += 1
+            self.blocked["bytes"] += ESTIMATED_BYTES.get(request.resource_type, DEFAULT_ESTIMATED_BYTES)
+            if request.resource_type == "image":
+                await route.fulfill(status=200, content_type="image/gif", body=BLANK_GIF)
+            else:
+                await route.abort("blockedbyclient")
+        except Exception: pass  # вкладка закрылась, пока запрос ждал решения
+
+    # --- SETTLE DETECTION ---
+    def _watch_page(self, page: Page):
+        """Подписка на сетевые и навигационные события вкладки"""
+        def on_request(request):
+            if request.resource_type in IGNORED_RESOURCE_TYPES: return
+            self._inflight.add(request)
+            self._last_network = time.monotonic()
+
+        def on_request_done(request):
+            self._inflight.discard(request)
+            self._last_network = time.monotonic()
+
+        def on_navigated(frame):
+            if frame == page.main_frame: self._last_navigation = time.monotonic()
+
+        page.on("request", on_request)
+        page.on("requestfinished", on_request_done)
+        page.on("requestfailed", on_request_done)
+        page.on("framenavigated", on_navigated)
+
+    async def wait_for_settle(self, max_wait: float = None) -> dict:
+        """
+        Ждет, пока страница успокоится: нет навигации, сеть простаивает
+        и DOM не меняется. Возвращает измеренное время ожидания.
+        """
+        max_wait = SETTLE_MAX_WAIT if max_wait is None else max_wait
+        started = time.monotonic()
+        deadline = started + max_wait
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0: break
+            check_started = time.monotonic()
+            try:
+                # Если идет переход - сначала дожидаемся нового документа
+                await self.page.wait_for_load_state("domcontentloaded", timeout=remaining * 1000)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0: break
+                await self.page.evaluate(DOM_QUIET_JS, [SETTLE_DOM_QUIET_MS, int(remaining * 1000), SETTLE_DOM_MAX_MUTATIONS])
+            except Exception:
+                # Контекст уничтожен навигацией посреди проверки - начинаем заново
+                if self.page.is_closed(): break
+                await asyncio.sleep(0.05)
+                continue
+
+            now = time.monotonic()
+            network_idle = (len(self._inflight) <= SETTLE_MAX_INFLIGHT and
+                            now - self._last_network >= SETTLE_NETWORK_QUIET_MS / 1000)
+            if network_idle and self._last_navigation < check_started: break
+            await asyncio.sleep(0.05)
+
+        elapsed = time.monotonic() - started
+        return {"settle_ms": int(elapsed * 1000), "settle_timeout": elapsed >= max_wait}
+
     async def stop(self):
         if self.context: await self.context.close()
         if self.playwright: await self.playwright.stop()
@@ -35,8 +231,8 @@ class BrowserController:
         if not url.startswith(('http', 'https')): url = 'https://' + url
         try:
             await self.page.goto(url, wait_until='domcontentloaded')
-            await asyncio.sleep(2)
-            return {"success": True, "url": self.page.url}
+            settle = await self.wait_for_settle()
+            return {"success": True, "url": self.page.url, **settle}
         except Exception as e: return {"success": False, "error": str(e)}
 
     # --- CLICK (Stable) ---
@@ -53,7 +249,6 @@ class BrowserController:
 
             if target:
                 await target.scroll_into_view_if_needed()
-                await asyncio.sleep(0.5)
                 try: await target.evaluate("el => { el.style.outline = '3px solid red'; }")
                 except: pass
                 
@@ -63,13 +258,18 @@ class BrowserController:
                 try: await target.evaluate("el => { el.style.outline = ''; }")
                 except: pass
                 
-                await asyncio.sleep(2)
-                return {"success": True, "message": f"Clicked {selector}"}
+                settle = await self.wait_for_settle()
+                return {"success": True, "message": f"Clicked {selector}", **settle}
             
             return {"success": False, "error": f"Not found: {selector}"}
         except Exception as e: return {"success": False, "error": str(e)}
 
-    # --- TRUE HUMAN TYPING ---
+    # --- ADAPTIVE INPUT ---
+    # Сначала быстрый fill + события input/change с проверкой, что значение
+    # "прижилось"; посимвольная эмуляция - только для сайтов, которые его отвергают.
+    # Выбранная стратегия запоминается по домену (общая для всех вкладок)
+    input_strategies = {}
+
     async def type_text(self, selector: str, text: str):
         try:
             target = None
@@ -80,40 +280,64 @@ class BrowserController:
                 target = await self.page.query_selector(selector)
 
             if target:
+                started = time.monotonic()
                 await target.scroll_into_view_if_needed()
-                
-                # 1. Фокус кликом (важно!)
-                try: await target.click()
-                except: pass
-                
-                # 2. Очистка через Ctrl+A -> Backspace (эмуляция, не JS)
-                await self.page.keyboard.press("Control+A")
-                await self.page.keyboard.press("Backspace")
-                await asyncio.sleep(0.2)
-
-                # 3. Ввод посимвольно
-                # Это вызывает все события keydown/keypress/input/keyup
-                await self.page.keyboard.type(text, delay=100)
-                
-                await asyncio.sleep(0.5)
-                return {"success": True}
+
+                domain = urlparse(self.page.url).hostname or ""
+                strategy = self.input_strategies.get(domain, "fill")
+                if strategy == "fill" and not await self._fast_fill(target, text):
+                    strategy = "keyboard"
+                if strategy == "keyboard":
+                    await self._type_keys(target, text)
+                self.input_strategies[domain] = strategy
+
+                input_ms = int((time.monotonic() - started) * 1000)
+                settle = await self.wait_for_settle()
+                return {"success": True, "strategy": strategy, "input_ms": input_ms, **settle}
             
             return {"success": False, "error": "Input not found"}
         except Exception as e: return {"success": False, "error": str(e)}
 
+    async def _fast_fill(self, target, text: str) -> bool:
+        """Быстрый ввод. False - сайт отверг значение (маска, контролируемый React-инпут и т.п.)"""
+        try:
+            await target.fill(text, timeout=2000)
+            await target.evaluate(FIRE_INPUT_EVENTS_JS)
+            # Даем фреймворку шанс перерисовать поле и откатить значение
+            await asyncio.sleep(0.15)
+            value = await target.evaluate(READ_VALUE_JS)
+            return (value or "").strip() == text.strip()
+        except Exception:
+            return False
+
+    async def _type_keys(self, target, text: str):
+        """TRUE HUMAN TYPING: физические нажатия клавиш для обхода защиты React/Vue"""
+        # 1. Фокус кликом (важно!)
+        try: await target.click()
+        except: pass
+
+        # 2. Очистка через Ctrl+A -> Backspace (эмуляция, не JS)
+        await self.page.keyboard.press("Control+A")
+        await self.page.keyboard.press("Backspace")
+        await asyncio.sleep(0.2)
+
+        # 3. Ввод посимвольно
+        # Это вызывает все события keydown/keypress/input/keyup
+        await self.page.keyboard.type(text, delay=TYPE_DELAY_MS)
+
     async def press_key(self, key: str):
         try: 
             await self.page.keyboard.press(key)
-            await asyncio.sleep(2)
-            return {"success": True}
+            settle = await self.wait_for_settle()
+            return {"success": True, **settle}
         except Exception as e: return {"success": False, "error": str(e)}
         
     async def scroll(self, direction="down"):
         try:
             if direction == "down": await self.page.mouse.wheel(0, 600)
             else: await self.page.mouse.wheel(0, -600)
-            await asyncio.sleep(1)
-            return {"success": True}
+            settle = await self.wait_for_settle()
+            return {"success": True, **settle}
         except Exception as e: return {"success": False, "error": str(e)}
         
     async def wait(self, seconds=1):
@@ -122,7 +346,8 @@ class BrowserController:
         
     async def go_back(self):
         await self.page.go_back()
-        return {"success": True}
+        settle = await self.wait_for_settle()
+        return {"success": True, **settle}
     
     async def hover(self, selector): return {"success": True} 
     async def fill(self, selector, text): return await self.type_text(selector, text)
\ No newline at end of file
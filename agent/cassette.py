@@ -0,0 +1,113 @@
+"""
+Кассета для запросов к LLM - запись и воспроизведение без сети.
+В режиме record ответы провайдеров сохраняются на диск вместе с
+нормализованной историей; в режиме replay отдаются обратно по хэшу
+канонической истории (опционально с записанной задержкой).
+Позволяет профилировать браузерную часть и цикл агента отдельно от
+модели и повторять инциденты локально.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Awaitable, Callable, Dict, List
+
+# Поля результатов инструментов, которые меняются от прогона к прогону
+# (на любой глубине: run_actions и spawn_agents вкладывают результаты шагов и подзадач)
+VOLATILE_RESULT_KEYS = ("settle_ms", "settle_timeout", "input_ms", "strategy", "duration_ms")
+
+
+class CassetteMiss(RuntimeError):
+    """В кассете нет ответа на такую историю"""
+
+
+def strip_volatile(value):
+    """Результат инструмента без полей VOLATILE_RESULT_KEYS, включая вложенные"""
+    if isinstance(value, dict):
+        return {k: strip_volatile(v) for k, v in value.items() if k not in VOLATILE_RESULT_KEYS}
+    if isinstance(value, list):
+        return [strip_volatile(v) for v in value]
+    return value
+
+
+def canonical_history(history: List[Dict]) -> List[Dict]:
+    """
+    История без случайных частей: ID вызовов инструментов (uuid провайдера)
+    заменяются порядковыми, из результатов убираются тайминги.
+    """
+    ids: Dict[str, str] = {}
+
+    def call_id(raw):
+        return ids.setdefault(raw, f"call_{len(ids)}")
+
+    out = []
+    for msg in history:
+        item = {"role": msg["role"], "content": msg.get("content") or ""}
+        if msg["role"] == "tool":
+            item["tool_call_id"] = call_id(msg.get("tool_call_id"))
+            item["name"] = msg.get("name")
+            try:
+                result = json.loads(item["content"])
+                if isinstance(result, dict): item["content"] = strip_volatile(result)
+            except ValueError: pass
+        if msg.get("tool_calls"):
+            item["tool_calls"] = [{"id": call_id(tc["id"]), "name": tc["name"], "args": tc["args"]} for tc in msg["tool_calls"]]
+        out.append(item)
+    return out
+
+
+class Cassette:
+    def __init__(self, mode: str, directory: str, replay_latency: bool = False, salt: str = ""):
+        self.mode = mode  # record | replay
+        self.directory = directory
+        self.replay_latency = replay_latency
+        # Соль - хэш системного промпта и схем инструментов: их смена делает записи недействительными
+        self.salt = salt
+        if mode == "record": os.makedirs(directory, exist_ok=True)
+
+    def key(self, history: List[Dict]) -> str:
+        payload = json.dumps([self.salt, canonical_history(history)], ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def wrap(self, provider: str, call: Callable[..., Awaitable[dict]]) -> Callable[..., Awaitable[dict]]:
+        """Обернуть вызов провайдера (history, on_text, on_tool_call) кассетой"""
+        async def recorded(history, on_text=None, on_tool_call=None):
+            started = time.monotonic()
+            response = await call(history, on_text, on_tool_call)
+            if response: self._save(provider, history, response, time.monotonic() - started)
+            return response
+
+        async def replayed(history, on_text=None, on_tool_call=None):
+            return await self._replay(history, on_text, on_tool_call)
+
+        return recorded if self.mode == "record" else replayed
+
+    def _save(self, provider: str, history, response: dict, latency: float):
+        key = self.key(history)
+        entry = {"key": key, "provider": provider, "latency": round(latency, 3),
+                 "request": canonical_history(history), "response": response}
+        try:
+            tmp = self._path(key) + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False, indent=1, default=str)
+            os.replace(tmp, self._path(key))
+        except OSError as e:
+            print(f"Cassette write failed: {e}")
+
+    async def _replay(self, history, on_text, on_tool_call) -> dict:
+        key = self.key(history)
+        try:
+            with open(self._path(key), encoding="utf-8") as f: entry = json.load(f)
+        except (OSError, ValueError):
+            raise CassetteMiss(f"Нет записи в кассете {self.directory} для истории из {len(history)} сообщений (ключ {key})")
+        if self.replay_latency: await asyncio.sleep(entry.get("latency", 0))
+        response = entry["response"]
+        # Стриминговые колбэки получают то же, что при живом ответе
+        if on_text and response.get("content"): await on_text(response["content"])
+        if on_tool_call:
+            for tool in response.get("tool_calls") or []: await on_tool_call(tool)
+        return response
@@ -6,6 +6,11 @@ from dataclasses import dataclass, field
 from datetime import datetime
 
 
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов (~4 символа на токен)"""
+    return len(text or "") // 4 + 1
+
+
 @dataclass
 class Action:
     """Запись о действии агента"""
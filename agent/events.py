@@ -0,0 +1,100 @@
+"""
+Шина событий задач - между AIAgent и WebSocket-клиентами.
+Агент публикует событие и сразу продолжает работу: ни медленный, ни
+отвалившийся клиент не тормозит цикл задачи. У каждой задачи своя лента
+с порядковыми номерами (seq) и кольцевым буфером последних событий:
+переподключившаяся панель догоняет ленту с нужного номера.
+Каждое подключение - подписчик с ограниченной очередью и фоновым
+отправителем, который склеивает всплески событий в пачки.
+"""
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Set
+
+from config import EVENT_HISTORY, EVENT_QUEUE_SIZE, EVENT_BATCH_WINDOW, EVENT_BATCH_MAX, EVENT_SEND_TIMEOUT
+
+
+class EventBus:
+    """Лента событий одной задачи"""
+
+    def __init__(self, task_id: str, history: int = EVENT_HISTORY):
+        self.task_id = task_id
+        self.seq = 0
+        self.events = deque(maxlen=history)
+        self.subscribers: Set["Subscriber"] = set()
+
+    async def publish(self, type: str, message: str):
+        """Совместим с log_callback агента; не ждет доставки"""
+        self.seq += 1
+        event = {"seq": self.seq, "type": type, "message": message, "task_id": self.task_id}
+        self.events.append(event)
+        for sub in list(self.subscribers): sub.push(event)
+
+    def since(self, seq: int) -> List[dict]:
+        return [e for e in self.events if e["seq"] > seq]
+
+
+class Subscriber:
+    """Одно подключение: подписки на ленты задач и фоновая отправка пачками"""
+
+    def __init__(self, send: Callable[[dict], Awaitable], queue_size: int = EVENT_QUEUE_SIZE):
+        self.send = send
+        self.queue = deque()
+        self.queue_size = queue_size
+        self.dropped = 0
+        self.buses: Set[EventBus] = set()
+        self._wakeup = asyncio.Event()
+        self._sender = asyncio.ensure_future(self._run())
+
+    def follow(self, bus: EventBus, since: int = None):
+        """Подписаться на ленту; since - догнать события после этого номера (None - только новые)"""
+        if since is not None:
+            # Уже стоящие в очереди события этой ленты придут в догонянии: иначе более
+            # свежее событие ушло бы раньше, и панель (пропуск по seq) отбросила бы догоняние
+            self.queue = deque(e for e in self.queue if e["task_id"] != bus.task_id)
+            for event in bus.since(since): self.push(event)
+        bus.subscribers.add(self)
+        self.buses.add(bus)
+
+    def push(self, event: dict):
+        if len(self.queue) >= self.queue_size:
+            # Клиент не успевает: теряем самое старое, клиент узнает об этом по "dropped"
+            self.queue.popleft()
+            self.dropped += 1
+        self.queue.append(event)
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            # Короткое окно, чтобы всплеск (стриминг мыслей, run_actions) ушел одной пачкой
+            await asyncio.sleep(EVENT_BATCH_WINDOW)
+            self._wakeup.clear()
+            while self.queue:
+                batch = coalesce([self.queue.popleft() for _ in range(min(len(self.queue), EVENT_BATCH_MAX))])
+                frame = {"type": "batch", "events": batch}
+                if self.dropped: frame["dropped"], self.dropped = self.dropped, 0
+                try:
+                    await asyncio.wait_for(self.send(frame), EVENT_SEND_TIMEOUT)
+                except Exception:
+                    self.close()
+                    return
+
+    def close(self):
+        for bus in self.buses: bus.subscribers.discard(self)
+        self.buses.clear()
+        self.queue.clear()
+        if not self._sender.done() and self._sender is not asyncio.current_task(): self._sender.cancel()
+
+
+def coalesce(events: List[dict]) -> List[dict]:
+    """Склеить подряд идущие куски стриминга мысли одной задачи в одно событие"""
+    out: List[Dict] = []
+    for event in events:
+        prev = out[-1] if out else None
+        if (prev and event["type"] == "thought_delta" and prev["type"] == "thought_delta"
+                and prev["task_id"] == event["task_id"]):
+            out[-1] = {**prev, "seq": event["seq"], "message": prev["message"] + event["message"]}
+        else:
+            out.append(event)
+    return out
@@ -0,0 +1,71 @@
+"""
+Сжатие истории диалога под бюджет токенов.
+История режется по целым шагам: сообщение ассистента с tool_calls всегда
+остается вместе со своими ответами tool, а старые шаги сворачиваются
+в сводку из ContextManager.
+"""
+import json
+from typing import List, Dict
+
+from .context_manager import estimate_tokens
+from config import HISTORY_COMPACT_TARGET
+
+
+def message_tokens(msg: Dict) -> int:
+    """Оценка размера сообщения в токенах (текст + аргументы вызовов)"""
+    tokens = estimate_tokens(str(msg.get("content") or "")) + 4
+    for tc in msg.get("tool_calls") or []:
+        tokens += estimate_tokens(tc["name"] + json.dumps(tc["args"], ensure_ascii=False)) + 4
+    return tokens
+
+
+def group_steps(messages: List[Dict]) -> List[List[Dict]]:
+    """
+    Разбить историю на неделимые шаги: мысль ассистента + его tool_calls +
+    все ответы tool на эти вызовы. Ответы без своего вызова отбрасываются.
+    """
+    steps, open_ids = [], set()
+    for msg in messages:
+        if msg["role"] == "tool":
+            if msg.get("tool_call_id") in open_ids: steps[-1].append(msg)
+            continue
+        # Мысль, за которой сразу идет вызов инструментов, - часть того же шага
+        prev = steps[-1] if steps else None
+        joins_thought = (msg.get("tool_calls") and prev and len(prev) == 1
+                         and prev[0]["role"] == "assistant" and not prev[0].get("tool_calls"))
+        if joins_thought: prev.append(msg)
+        else: steps.append([msg])
+        open_ids = {tc["id"] for tc in msg.get("tool_calls") or []}
+    return steps
+
+
+def compact_history(history: List[Dict], summary: str, max_tokens: int, target: float = HISTORY_COMPACT_TARGET) -> List[Dict]:
+    """
+    Первое сообщение (задача) закреплено. Пока история помещается в бюджет,
+    она не меняется. При переполнении с конца берутся целые шаги, пока
+    помещаются в долю target бюджета; все, что старше, заменяется одной
+    сводкой. Запас до полного бюджета держит сводку и шаги неизменными
+    несколько ходов подряд - префикс промпта остается в кэше провайдера.
+    Последний шаг сохраняется всегда, даже если он один больше бюджета.
+    """
+    if not history: return history
+    if sum(message_tokens(m) for m in history) <= max_tokens: return history
+    head, rest = history[0], [m for m in history[1:] if not m.get("summary")]
+    steps = group_steps(rest)
+
+    summary_msg = {"role": "user", "content": f"Summary of earlier steps (older messages were removed):\n{summary}", "summary": True}
+    budget = int(max_tokens * target) - message_tokens(head) - message_tokens(summary_msg)
+
+    kept = []
+    for step in reversed(steps):
+        cost = sum(message_tokens(m) for m in step)
+        if kept and cost > budget: break
+        kept.insert(0, step)
+        budget -= cost
+
+    kept_msgs = [m for step in kept for m in step]
+    if len(kept) == len(steps):
+        # Ничего нового не выпало - прежняя сводка (если была) остается как есть
+        old_summary = [m for m in history[1:] if m.get("summary")][:1]
+        return [head] + old_summary + kept_msgs
+    return [head, summary_msg] + kept_msgs
@@ -0,0 +1,128 @@
+"""
+Журнал прогонов - каждый шаг execute_task на диске (SQLite, WAL).
+Агент только кладет записи в очередь; в базу их пишет фоновый поток
+пачками, так что цикл задачи никогда не ждет диск. Чтение - отдельными
+соединениями (WAL позволяет читать параллельно с записью).
+"""
+import json
+import queue
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from config import JOURNAL_FILE
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id TEXT PRIMARY KEY, task TEXT, status TEXT, result TEXT,
+    started REAL, finished REAL, steps INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS steps (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, run_id TEXT, step INTEGER, ts REAL,
+    thought TEXT, tool TEXT, args TEXT, success INTEGER, result_size INTEGER,
+    llm_ms INTEGER, tool_ms INTEGER, settle_ms INTEGER, url TEXT
+);
+CREATE INDEX IF NOT EXISTS steps_run ON steps (run_id, id);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started);
+"""
+
+STEP_FIELDS = ("step", "thought", "tool", "args", "success", "result_size", "llm_ms", "tool_ms", "settle_ms", "url")
+BATCH_SIZE = 200
+
+
+class Journal:
+    def __init__(self, path: str = JOURNAL_FILE):
+        self.path = path
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    # --- Запись (из цикла агента: только очередь) ---
+    def start_run(self, run_id: str, task: str):
+        self._put(("INSERT OR REPLACE INTO runs (id, task, status, started) VALUES (?, ?, 'running', ?)",
+                   (run_id, task, time.time())))
+
+    def step(self, run_id: str, record: dict):
+        record = dict(record, args=json.dumps(record.get("args") or {}, ensure_ascii=False, default=str),
+                      success=int(bool(record.get("success"))))
+        self._put((f"INSERT INTO steps (run_id, ts, {', '.join(STEP_FIELDS)}) VALUES (?, ?, {', '.join('?' * len(STEP_FIELDS))})",
+                   (run_id, time.time(), *(record.get(f) for f in STEP_FIELDS))))
+        self._put(("UPDATE runs SET steps = steps + 1 WHERE id = ?", (run_id,)))
+
+    def finish_run(self, run_id: str, status: str, result: str = ""):
+        self._put(("UPDATE runs SET status = ?, result = ?, finished = ? WHERE id = ?",
+                   (status, result, time.time(), run_id)))
+
+    def _put(self, item):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._writer, name="journal-writer", daemon=True)
+                    self._thread.start()
+        self._queue.put_nowait(item)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _writer(self):
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            while item is not None and len(batch) < BATCH_SIZE:
+                try: item = self._queue.get_nowait()
+                except queue.Empty: break
+                batch.append(item)
+            try:
+                with conn:  # одна транзакция на пачку
+                    for entry in batch:
+                        if entry is not None: conn.execute(*entry)
+            except sqlite3.Error as e:
+                print(f"Journal write failed: {e}")
+            if batch[-1] is None:
+                conn.close()
+                return
+
+    def close(self):
+        """Дописать очередь и остановить поток записи"""
+        if self._thread is None: return
+        self._queue.put(None)
+        self._thread.join(timeout=10)
+        self._thread = None
+
+    # --- Чтение (постранично) ---
+    def _read(self, sql: str, params=()) -> list:
+        try:
+            conn = self._connect()
+        except sqlite3.Error:
+            return []
+        try:
+            return [dict(row) for row in conn.execute(sql, params)]
+        except sqlite3.OperationalError:
+            return []  # базы еще нет: ни одного прогона
+        finally:
+            conn.close()
+
+    def runs(self, offset: int = 0, limit: int = 50) -> dict:
+        total = self._read("SELECT COUNT(*) AS n FROM runs")
+        rows = self._read("SELECT * FROM runs ORDER BY started DESC LIMIT ? OFFSET ?", (limit, offset))
+        return {"total": total[0]["n"] if total else 0, "offset": offset, "limit": limit, "runs": rows}
+
+    def steps(self, run_id: str, offset: int = 0, limit: int = 100) -> Optional[dict]:
+        run = self._read("SELECT * FROM runs WHERE id = ?", (run_id,))
+        if not run: return None
+        rows = self._read("SELECT * FROM steps WHERE run_id = ? ORDER BY id LIMIT ? OFFSET ?", (run_id, limit, offset))
+        for row in rows:
+            row["args"] = json.loads(row["args"] or "{}")
+            row["success"] = bool(row["success"])
+        return {"run": run[0], "total": run[0]["steps"], "offset": offset, "limit": limit, "steps": rows}
+
+
+# Один журнал на процесс: его делят все агенты
+JOURNAL = Journal()
@@ -0,0 +1,178 @@
+"""
+Маршрутизатор LLM-провайдеров.
+- Скользящая статистика задержек и ошибок по каждому провайдеру
+- Хедж-запросы: если основной провайдер молчит дольше порога, параллельно
+  запускается запасной; побеждает тот, кто ответит первым, второй отменяется
+- Circuit breaker: сбоящий провайдер выводится из ротации и через паузу
+  пропускается пробным запросом (half-open), чтобы вернуть его в строй
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List
+
+from config import (ROUTER_WINDOW, ROUTER_HEDGE_DELAY, ROUTER_HEDGE_MIN_DELAY, ROUTER_FAILURE_THRESHOLD,
+                    ROUTER_ERROR_RATE, ROUTER_COOLDOWN)
+
+
+class ProviderStats:
+    """Скользящее окно задержек/ошибок и состояние предохранителя одного провайдера"""
+
+    def __init__(self, window: int = ROUTER_WINDOW):
+        self.samples = deque(maxlen=window)  # (latency, ok)
+        self.state = "closed"  # closed | open | half_open
+        self.opened_at = 0.0
+        self.consecutive_failures = 0
+        self.probe_in_flight = False
+
+    def latency(self, q: float):
+        """Квантиль задержки успешных запросов (None, если данных мало)"""
+        ok = sorted(lat for lat, success in self.samples if success)
+        if len(ok) < 5: return None
+        return ok[min(int(len(ok) * q), len(ok) - 1)]
+
+    @property
+    def error_rate(self) -> float:
+        if not self.samples: return 0.0
+        return sum(1 for _, success in self.samples if not success) / len(self.samples)
+
+    def available(self, now: float) -> bool:
+        if self.state == "open" and now - self.opened_at >= ROUTER_COOLDOWN:
+            self.state = "half_open"
+        if self.state == "half_open":
+            # Пропускаем ровно один пробный запрос
+            return not self.probe_in_flight
+        return self.state == "closed"
+
+    def record(self, latency: float, ok: bool):
+        self.samples.append((latency, ok))
+        if ok:
+            self.consecutive_failures = 0
+            self.state = "closed"
+            return
+        self.consecutive_failures += 1
+        tripped = (self.consecutive_failures >= ROUTER_FAILURE_THRESHOLD or
+                   (len(self.samples) >= 5 and self.error_rate >= ROUTER_ERROR_RATE))
+        if self.state == "half_open" or tripped:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def to_dict(self) -> dict:
+        return {"state": self.state, "error_rate": round(self.error_rate, 3),
+                "p50": self.latency(0.5), "p95": self.latency(0.95), "samples": len(self.samples)}
+
+
+# Статистика общая для всех агентов процесса: предохранитель срабатывает
+# по опыту всех задач, а не заново в каждой
+PROVIDER_STATS: Dict[str, ProviderStats] = {}
+
+
+class LLMRouter:
+    def __init__(self, providers: Dict[str, Callable[..., Awaitable[dict]]], order: List[str], stats: Dict[str, ProviderStats] = None):
+        self.providers = providers
+        self.order = [name for name in order if name in providers]
+        self.stats = PROVIDER_STATS if stats is None else stats
+        for name in self.order: self.stats.setdefault(name, ProviderStats())
+        self.last_provider = None
+        self.observer = None  # observer(provider, latency, ok) - для телеметрии
+
+    def _candidates(self) -> List[str]:
+        now = time.monotonic()
+        available = [name for name in self.order if self.stats[name].available(now)]
+        # Все предохранители открыты - лучше попробовать, чем не отвечать вовсе
+        return available or self.order[:1]
+
+    def _hedge_delay(self, name: str) -> float:
+        p95 = self.stats[name].latency(0.95)
+        if p95 is None: return ROUTER_HEDGE_DELAY
+        return min(max(p95, ROUTER_HEDGE_MIN_DELAY), ROUTER_HEDGE_DELAY)
+
+    async def _attempt(self, name: str, history, on_text, on_tool_call, lost: set) -> dict:
+        stats = self.stats[name]
+        if stats.state == "half_open": stats.probe_in_flight = True
+        started = time.monotonic()
+        try:
+            response = await self.providers[name](history, on_text, on_tool_call)
+        except asyncio.CancelledError:
+            # Проигравший хедж не ответил за порог хеджа - это сбой (иначе зависший провайдер
+            # никогда не разомкнет предохранитель). Отмена по stop() не учитывается вовсе
+            if name in lost: self._record(name, time.monotonic() - started, False)
+            raise
+        except Exception:
+            self._record(name, time.monotonic() - started, False)
+            raise
+        finally:
+            stats.probe_in_flight = False
+        self._record(name, time.monotonic() - started, True)
+        return response
+
+    def _record(self, name: str, latency: float, ok: bool):
+        self.stats[name].record(latency, ok)
+        if self.observer: self.observer(name, latency, ok)
+
+    async def call(self, history, on_text=None, on_tool_call=None) -> dict:
+        candidates = self._candidates()
+        backups = candidates[1:]
+        attempts: Dict[str, asyncio.Future] = {}
+        winner = None
+        last_error = None
+        lost = set()  # проигравшие хедж (в отличие от отмены всего вызова)
+
+        def cancel_others(keep: str):
+            for name, fut in attempts.items():
+                if name != keep:
+                    lost.add(name)
+                    fut.cancel()
+
+        # При стриминге победитель определяется по первому событию: тексту
+        # или вызову инструмента. События проигравшего не доходят до агента
+        def gate(name, cb):
+            if cb is None: return None
+            async def wrapper(item):
+                nonlocal winner
+                if winner is None:
+                    winner = name
+                    cancel_others(name)
+                if winner == name: await cb(item)
+            return wrapper
+
+        def start(name):
+            attempts[name] = asyncio.ensure_future(self._attempt(name, history, gate(name, on_text), gate(name, on_tool_call), lost))
+
+        start(candidates[0])
+        try:
+            while attempts:
+                hedge = backups and winner is None and len(attempts) == 1
+                timeout = self._hedge_delay(next(iter(attempts))) if hedge else None
+                done, _ = await asyncio.wait(list(attempts.values()), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Основной провайдер медлит - запускаем запасной параллельно. Если за время
+                    # ожидания он уже начал стримить, победитель есть и запасной не нужен
+                    if winner is None: start(backups.pop(0))
+                    continue
+
+                for fut in done:
+                    name = next(n for n, f in attempts.items() if f is fut)
+                    del attempts[name]
+                    if fut.cancelled(): continue
+                    if fut.exception() is None and winner in (None, name):
+                        cancel_others(name)
+                        self.last_provider = name
+                        return fut.result()
+                    if fut.exception() is not None:
+                        last_error = fut.exception()
+                        print(f"LLM provider {name} failed: {last_error}")
+                        # Стрим этого провайдера уже выдал действия - повтор их бы продублировал
+                        if winner == name: raise last_error
+
+                # Ошибка без активных попыток - сразу переходим к запасному
+                if not attempts and backups and winner is None:
+                    start(backups.pop(0))
+        finally:
+            for fut in attempts.values(): fut.cancel()
+
+        if last_error: raise last_error
+        return {}
+
+    def status(self) -> dict:
+        return {name: self.stats[name].to_dict() for name in self.order}
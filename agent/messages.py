@@ -0,0 +1,35 @@
+"""
+Кэш кодировок истории под форматы провайдеров.
+История агента - канонический список сообщений (role/content/tool_calls);
+каждое сообщение переводится в формат провайдера один раз, а на
+следующих ходах берется из кэша: кодируются только новые сообщения.
+Ключ - идентичность объекта сообщения (плюс его content: строку могут
+заменить, например при дописывании заметки к задаче).
+"""
+from typing import Callable, Dict, List
+
+
+class EncodingCache:
+    """Закодированные сообщения текущей истории для одного провайдера"""
+
+    def __init__(self, encode: Callable[[dict], object]):
+        self.encode = encode
+        self._entries: Dict[int, tuple] = {}  # id(msg) -> (msg, content, encoded)
+        self.hits = 0
+        self.misses = 0
+
+    def encode_history(self, history: List[dict]) -> list:
+        entries, out = {}, []
+        for msg in history:
+            entry = self._entries.get(id(msg))
+            # id может достаться новому объекту после сборки мусора - сверяем сам объект
+            if entry is None or entry[0] is not msg or entry[1] is not msg.get("content"):
+                entry = (msg, msg.get("content"), self.encode(msg))
+                self.misses += 1
+            else:
+                self.hits += 1
+            entries[id(msg)] = entry
+            out.append(entry[2])
+        # Храним только сообщения текущей истории: сжатые шаги уходят из кэша вместе с ней
+        self._entries = entries
+        return out
@@ -0,0 +1,88 @@
+"""
+Телеметрия агента - гистограммы времени и размеров по шагам.
+Глобальный реестр отдается сервером в формате Prometheus (/metrics),
+а TaskMetrics собирает те же наблюдения по одной задаче для сводки.
+"""
+import bisect
+from typing import Dict, List, Tuple
+
+TIME_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 60)
+TOKEN_BUCKETS = (100, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+CHAR_BUCKETS = (1000, 5000, 10000, 20000, 50000, 100000, 200000)
+
+
+class Histogram:
+    """Гистограмма Prometheus с метками"""
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...], labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.labelnames = labelnames
+        self._series: Dict[tuple, list] = {}  # значения меток -> [счетчики корзин..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+        idx = bisect.bisect_left(self.buckets, value)
+        if idx < len(self.buckets): series[idx] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self._series.items()):
+            base = ",".join(f'{n}="{v}"' for n, v in zip(self.labelnames, key))
+            sep = "," if base else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {series[-1]}')
+            labels = f"{{{base}}}" if base else ""
+            lines.append(f"{self.name}_sum{labels} {series[-2]}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+LLM_LATENCY = Histogram("agent_llm_latency_seconds", "LLM request latency per provider", TIME_BUCKETS, ("provider", "outcome"))
+LLM_PROMPT_TOKENS = Histogram("agent_llm_prompt_tokens", "Prompt tokens per LLM request", TOKEN_BUCKETS, ("provider",))
+LLM_CACHED_TOKENS = Histogram("agent_llm_cached_tokens", "Prompt tokens served from provider cache", TOKEN_BUCKETS, ("provider",))
+LLM_RESPONSE_TOKENS = Histogram("agent_llm_response_tokens", "Response tokens per LLM request", TOKEN_BUCKETS, ("provider",))
+TOOL_DURATION = Histogram("agent_tool_duration_seconds", "_execute_tool duration per tool", TIME_BUCKETS, ("tool",))
+SNAPSHOT_DURATION = Histogram("agent_snapshot_seconds", "get_compact_state duration", TIME_BUCKETS, ("engine",))
+SNAPSHOT_SIZE = Histogram("agent_snapshot_chars", "get_compact_state output size", CHAR_BUCKETS, ("engine",))
+SLEEP_DURATION = Histogram("agent_sleep_seconds", "Time spent in built-in waits", TIME_BUCKETS, ("reason",))
+ITERATION_DURATION = Histogram("agent_iteration_seconds", "Full agent loop iteration", TIME_BUCKETS)
+
+REGISTRY = [LLM_LATENCY, LLM_PROMPT_TOKENS, LLM_CACHED_TOKENS, LLM_RESPONSE_TOKENS, TOOL_DURATION,
+            SNAPSHOT_DURATION, SNAPSHOT_SIZE, SLEEP_DURATION, ITERATION_DURATION]
+
+
+def render_prometheus() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class TaskMetrics:
+    """Наблюдения одной задачи: пишутся и в глобальный реестр, и в локальную сводку"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+
+    def observe(self, metric: Histogram, value: float, **labels):
+        metric.observe(value, **labels)
+        label = ",".join(str(v) for v in labels.values())
+        key = f"{metric.name}{{{label}}}" if label else metric.name
+        self.samples.setdefault(key, []).append(value)
+
+    def summary(self) -> dict:
+        """count / sum / p50 / max по каждой серии"""
+        out = {}
+        for key, values in sorted(self.samples.items()):
+            ordered = sorted(values)
+            out[key] = {"count": len(values), "sum": round(sum(values), 3),
+                        "p50": round(ordered[len(ordered) // 2], 3), "max": round(ordered[-1], 3)}
+        return out
@@ -4,124 +4,562 @@
 Строит полное дерево для понимания контекста.
 """
 import os
+import re
+import time
 from playwright.async_api import Page
-from config import DEBUG_MODE
+from config import DEBUG_MODE, SNAPSHOT_ENGINE, SNAPSHOT_DELTA_MAX_RATIO, SNAPSHOT_TOKEN_BUDGET
+from .context_manager import estimate_tokens
+from .metrics import SNAPSHOT_DURATION, SNAPSHOT_SIZE
+from .ax_snapshot import AXSnapshot
 
-class PageAnalyzer:
-    def __init__(self, page: Page):
-        self.page = page
+ID_LINE_RE = re.compile(r"^\s*\[(\d+)\]")
+TAG_RE = re.compile(r"<(\w+)>")
+WORD_RE = re.compile(r"\w{3,}")
+INPUT_TAGS = ("input", "textarea", "select", "button")
+# Движки со стабильными ID элементов - для них возможны дельты снимков
+STABLE_ID_ENGINES = ("index", "ax")
+MAX_FOLDS = 100
 
-    async def get_compact_state(self) -> str:
-        tree = await self.page.evaluate('''() => {
-            // КОНФИГУРАЦИЯ
-            const MAX_TEXT_LEN = 100;
-            const MAX_DEPTH = 20; // Глубокая вложенность для сложных сайтов
-            let robotId = 0;
+# Положение интерактивных элементов относительно окна (для ранжирования)
+POSITIONS_JS = """() => {
+    const tops = {};
+    document.querySelectorAll('[data-r-id]').forEach(el => {
+        tops[el.getAttribute('data-r-id')] = el.getBoundingClientRect().top;
+    });
+    return [window.innerHeight, tops];
+}"""
+
+# Метка документа: меняется при любой перезагрузке, даже на том же URL
+DOC_TOKEN_JS = """() => {
+    if (!window.__aiDoc) window.__aiDoc = Math.random().toString(36).slice(2);
+    return window.__aiDoc;
+}"""
+
+# Полный обход DOM при каждом вызове (исходный движок)
+LEGACY_SNAPSHOT_JS = '''() => {
+    // КОНФИГУРАЦИЯ
+    const MAX_TEXT_LEN = 100;
+    const MAX_DEPTH = 20; // Глубокая вложенность для сложных сайтов
+    let robotId = 0;
+    
+    // Чистим старые ID
+    document.querySelectorAll('[data-r-id]').forEach(el => el.removeAttribute('data-r-id'));
+
+    // Проверка видимости
+    function isVisible(el) {
+        const rect = el.getBoundingClientRect();
+        if (rect.width < 1 || rect.height < 1) return false;
+        // Чуть шире экрана (на 1000px), чтобы видеть предзагруженный контент
+        if (rect.bottom < -200 || rect.top > window.innerHeight + 800) return false;
+        
+        const style = window.getComputedStyle(el);
+        return style.display !== 'none' && style.visibility !== 'hidden' && style.opacity !== '0';
+    }
+
+    function cleanText(text) {
+        return (text || '').replace(/\\s+/g, ' ').trim().substring(0, MAX_TEXT_LEN);
+    }
+
+    // Главная функция обхода
+    function traverse(element, depth) {
+        if (depth > MAX_DEPTH) return '';
+        if (!isVisible(element)) return '';
+
+        let output = '';
+        const tagName = element.tagName.toLowerCase();
+        const style = window.getComputedStyle(element);
+        
+        // 1. ОПРЕДЕЛЕНИЕ ТИПА (Интерактивный?)
+        const isClickable = (
+            tagName === 'a' || tagName === 'button' || tagName === 'input' || 
+            tagName === 'select' || tagName === 'textarea' ||
+            element.getAttribute('role') === 'button' ||
+            style.cursor === 'pointer' ||
+            element.onclick != null
+        );
+
+        // 2. ПОЛУЧЕНИЕ СОБСТВЕННОГО ТЕКСТА
+        // (Текст, который лежит прямо в этом элементе, а не в детях)
+        let directText = '';
+        if (element.childNodes) {
+            Array.from(element.childNodes).forEach(node => {
+                if (node.nodeType === Node.TEXT_NODE) {
+                    directText += node.textContent;
+                }
+            });
+        }
+        directText = cleanText(directText);
+        
+        // Атрибуты (для контекста)
+        const label = cleanText(element.getAttribute('aria-label') || element.getAttribute('title') || element.getAttribute('placeholder'));
+        const role = element.getAttribute('role');
+
+        // 3. РЕШЕНИЕ: ДОБАВЛЯТЬ ЛИ В ДЕРЕВО?
+        // Добавляем, если:
+        // - Это кнопка/ссылка (даже пустая)
+        // - Это контейнер с текстом (цена, название)
+        // - Это картинка (важно для еды)
+        
+        let shouldShow = isClickable || (directText.length > 1) || (label.length > 1) || tagName === 'img';
+
+        if (shouldShow) {
+            const indent = '  '.repeat(depth);
+            let line = `${indent}`;
             
-            // Чистим старые ID
-            document.querySelectorAll('[data-r-id]').forEach(el => el.removeAttribute('data-r-id'));
-
-            // Проверка видимости
-            function isVisible(el) {
-                const rect = el.getBoundingClientRect();
-                if (rect.width < 1 || rect.height < 1) return false;
-                // Чуть шире экрана (на 1000px), чтобы видеть предзагруженный контент
-                if (rect.bottom < -200 || rect.top > window.innerHeight + 800) return false;
-                
-                const style = window.getComputedStyle(el);
-                return style.display !== 'none' && style.visibility !== 'hidden' && style.opacity !== '0';
+            // Если можно кликнуть - даем ID
+            if (isClickable) {
+                robotId++;
+                element.setAttribute('data-r-id', robotId);
+                line += `[${robotId}] <${tagName}>`;
+            } else {
+                // Просто тег (для структуры)
+                line += `<${tagName}>`;
             }
 
-            function cleanText(text) {
-                return (text || '').replace(/\\s+/g, ' ').trim().substring(0, MAX_TEXT_LEN);
+            // Добавляем контент
+            if (directText) line += ` "${directText}"`;
+            if (label) line += ` [Label: ${label}]`;
+            if (tagName === 'img' && element.alt) line += ` [Img: ${cleanText(element.alt)}]`;
+            
+            output += line + '\\n';
+        }
+
+        // 4. РЕКУРСИЯ
+        // Если элемент - это просто контейнер без текста, мы не выводим его строку,
+        // но ОБЯЗАТЕЛЬНО идем внутрь искать детей.
+        // Но если мы уже вывели строку (shouldShow=true), то дети будут с отступом.
+        // Если нет (shouldShow=false), то дети будут на том же уровне (flattening),
+        // чтобы не плодить пустые <div>.
+        
+        const childDepth = shouldShow ? depth + 1 : depth;
+        
+        for (const child of element.children) {
+            output += traverse(child, childDepth);
+        }
+
+        return output;
+    }
+
+    const structure = traverse(document.body, 0);
+    
+    if (!structure.trim()) return "Page seems empty (Scripts loading?). Wait...";
+    
+    return `URL: ${window.location.href}\\nSCROLL: ${window.scrollY}\\n\\n${structure}`;
+}'''
+
+# Оптимизированный полный обход: один проход TreeWalker, getComputedStyle
+# один раз на узел и только после отсечения по геометрии, сборка через join.
+# Вывод должен совпадать с LEGACY_SNAPSHOT_JS байт в байт: сверка на фикстурах -
+# benchmarks/bench_snapshot.py (нужен headless Chromium)
+FAST_SNAPSHOT_JS = '''() => {
+    const MAX_TEXT_LEN = 100;
+    const MAX_DEPTH = 20;
+    const WIN_TOP = -200;
+    const WIN_BOTTOM = window.innerHeight + 800;
+    let robotId = 0;
+
+    document.querySelectorAll('[data-r-id]').forEach(el => el.removeAttribute('data-r-id'));
+
+    function cleanText(text) {
+        return (text || '').replace(/\\s+/g, ' ').trim().substring(0, MAX_TEXT_LEN);
+    }
+
+    const out = [];
+
+    // Возвращает глубину для детей или -1, если поддерево отсекается целиком
+    function visit(element, depth) {
+        if (depth > MAX_DEPTH) return -1;
+        const rect = element.getBoundingClientRect();
+        if (rect.width < 1 || rect.height < 1 || rect.bottom < WIN_TOP || rect.top > WIN_BOTTOM) return -1;
+        const style = window.getComputedStyle(element);
+        if (style.display === 'none' || style.visibility === 'hidden' || style.opacity === '0') return -1;
+
+        const tagName = element.tagName.toLowerCase();
+        const isClickable = (
+            tagName === 'a' || tagName === 'button' || tagName === 'input' ||
+            tagName === 'select' || tagName === 'textarea' ||
+            element.getAttribute('role') === 'button' ||
+            style.cursor === 'pointer' ||
+            element.onclick != null
+        );
+
+        let directText = '';
+        for (let node = element.firstChild; node; node = node.nextSibling) {
+            if (node.nodeType === Node.TEXT_NODE) directText += node.textContent;
+        }
+        directText = cleanText(directText);
+        const label = cleanText(element.getAttribute('aria-label') || element.getAttribute('title') || element.getAttribute('placeholder'));
+
+        if (!(isClickable || directText.length > 1 || label.length > 1 || tagName === 'img')) return depth;
+
+        const parts = ['  '.repeat(depth)];
+        if (isClickable) {
+            robotId++;
+            element.setAttribute('data-r-id', robotId);
+            parts.push(`[${robotId}] <${tagName}>`);
+        } else {
+            parts.push(`<${tagName}>`);
+        }
+        if (directText) parts.push(` "${directText}"`);
+        if (label) parts.push(` [Label: ${label}]`);
+        if (tagName === 'img' && element.alt) parts.push(` [Img: ${cleanText(element.alt)}]`);
+        out.push(parts.join(''));
+        return depth + 1;
+    }
+
+    // Итеративный обход без рекурсии: стек хранит глубину открытых предков
+    const walker = document.createTreeWalker(document.body, NodeFilter.SHOW_ELEMENT);
+    const stack = [];
+    let depth = 0;
+    walk: while (true) {
+        const childDepth = visit(walker.currentNode, depth);
+        if (childDepth >= 0 && walker.firstChild()) {
+            stack.push(depth);
+            depth = childDepth;
+            continue;
+        }
+        while (!walker.nextSibling()) {
+            if (!stack.length) break walk;
+            walker.parentNode();
+            depth = stack.pop();
+        }
+    }
+
+    if (!out.length) return "Page seems empty (Scripts loading?). Wait...";
+    return `URL: ${window.location.href}\\nSCROLL: ${window.scrollY}\\n\\n${out.join('\\n')}\\n`;
+}'''
+
+# Постоянный индекс внутри документа: ставится один раз, MutationObserver
+# помечает измененные поддеревья, а снимок пересобирает только их.
+# ID элементов стабильны между вызовами (не перенумеровываются).
+INDEX_SNAPSHOT_JS = '''() => {
+    if (!window.__aiIndex) {
+        const MAX_TEXT_LEN = 100;
+        const MAX_DEPTH = 20;
+        // el -> {depth, rect, inside, out}: готовый текст всего поддерева
+        let cache = new WeakMap();
+        let robotId = 0;
+
+        function markDirty(node) {
+            // Все предки зависят от текста поддерева - сбрасываем цепочку целиком
+            let el = node.nodeType === Node.ELEMENT_NODE ? node : node.parentElement;
+            for (; el; el = el.parentElement) cache.delete(el);
+        }
+
+        function onMutations(records) {
+            for (const r of records) {
+                // Собственные пометки ID не должны инвалидировать кэш
+                if (r.type === 'attributes' && r.attributeName === 'data-r-id') continue;
+                markDirty(r.target);
+                // class/style наследуются (cursor, visibility) - сбрасываем и потомков
+                if (r.type === 'attributes' && r.target.querySelectorAll) {
+                    r.target.querySelectorAll('*').forEach(el => cache.delete(el));
+                }
             }
+        }
+
+        const observer = new MutationObserver(onMutations);
+        observer.observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+
+        // Видимость меняется и без мутаций DOM: прокрутка внутреннего контейнера,
+        // меню по :hover/:focus, смена размера окна. Такие элементы копятся здесь и
+        // сбрасываются перед снимком (сами события частые - работы в них минимум)
+        const touched = new Set();
+        let resized = false;
+        const touch = e => { if (e.target.nodeType === Node.ELEMENT_NODE) touched.add(e.target); };
+        for (const type of ['scroll', 'mouseover', 'mouseout', 'focusin', 'focusout']) {
+            document.addEventListener(type, touch, {capture: true, passive: true});
+        }
+        window.addEventListener('resize', () => { resized = true; });
+
+        function cleanText(text) {
+            return (text || '').replace(/\\s+/g, ' ').trim().substring(0, MAX_TEXT_LEN);
+        }
 
-            // Главная функция обхода
-            function traverse(element, depth) {
-                if (depth > MAX_DEPTH) return '';
-                if (!isVisible(element)) return '';
+        function sameRect(a, b) {
+            return a.top === b.top && a.left === b.left && a.width === b.width && a.height === b.height;
+        }
 
-                let output = '';
+        function traverse(element, depth) {
+            if (depth > MAX_DEPTH) return '';
+
+            const r = element.getBoundingClientRect();
+            const winBottom = window.innerHeight + 800;
+            // Прямоугольник в координатах документа: не меняется при прокрутке
+            const rect = {top: r.top + window.scrollY, left: r.left + window.scrollX, width: r.width, height: r.height};
+            const inside = r.top >= -200 && r.bottom <= winBottom;
+
+            // Поддерево целиком в окне видимости и не менялось - отдаем из кэша
+            const cached = cache.get(element);
+            if (cached && cached.depth === depth && cached.inside && inside && sameRect(cached.rect, rect)) {
+                return cached.out;
+            }
+
+            let output = '';
+            const visible = r.width >= 1 && r.height >= 1 && r.bottom >= -200 && r.top <= winBottom;
+            const style = visible ? window.getComputedStyle(element) : null;
+            if (style && style.display !== 'none' && style.visibility !== 'hidden' && style.opacity !== '0') {
                 const tagName = element.tagName.toLowerCase();
-                const style = window.getComputedStyle(element);
-                
-                // 1. ОПРЕДЕЛЕНИЕ ТИПА (Интерактивный?)
                 const isClickable = (
-                    tagName === 'a' || tagName === 'button' || tagName === 'input' || 
+                    tagName === 'a' || tagName === 'button' || tagName === 'input' ||
                     tagName === 'select' || tagName === 'textarea' ||
                     element.getAttribute('role') === 'button' ||
                     style.cursor === 'pointer' ||
                     element.onclick != null
                 );
 
-                // 2. ПОЛУЧЕНИЕ СОБСТВЕННОГО ТЕКСТА
-                // (Текст, который лежит прямо в этом элементе, а не в детях)
                 let directText = '';
-                if (element.childNodes) {
-                    Array.from(element.childNodes).forEach(node => {
-                        if (node.nodeType === Node.TEXT_NODE) {
-                            directText += node.textContent;
-                        }
-                    });
+                for (const node of element.childNodes) {
+                    if (node.nodeType === Node.TEXT_NODE) directText += node.textContent;
                 }
                 directText = cleanText(directText);
-                
-                // Атрибуты (для контекста)
                 const label = cleanText(element.getAttribute('aria-label') || element.getAttribute('title') || element.getAttribute('placeholder'));
-                const role = element.getAttribute('role');
-
-                // 3. РЕШЕНИЕ: ДОБАВЛЯТЬ ЛИ В ДЕРЕВО?
-                // Добавляем, если:
-                // - Это кнопка/ссылка (даже пустая)
-                // - Это контейнер с текстом (цена, название)
-                // - Это картинка (важно для еды)
-                
-                let shouldShow = isClickable || (directText.length > 1) || (label.length > 1) || tagName === 'img';
+                const shouldShow = isClickable || (directText.length > 1) || (label.length > 1) || tagName === 'img';
 
                 if (shouldShow) {
-                    const indent = '  '.repeat(depth);
-                    let line = `${indent}`;
-                    
-                    // Если можно кликнуть - даем ID
+                    let line = '  '.repeat(depth);
                     if (isClickable) {
-                        robotId++;
-                        element.setAttribute('data-r-id', robotId);
-                        line += `[${robotId}] <${tagName}>`;
+                        let id = element.getAttribute('data-r-id');
+                        if (!id) { id = String(++robotId); element.setAttribute('data-r-id', id); }
+                        line += `[${id}] <${tagName}>`;
                     } else {
-                        // Просто тег (для структуры)
                         line += `<${tagName}>`;
                     }
-
-                    // Добавляем контент
                     if (directText) line += ` "${directText}"`;
                     if (label) line += ` [Label: ${label}]`;
                     if (tagName === 'img' && element.alt) line += ` [Img: ${cleanText(element.alt)}]`;
-                    
                     output += line + '\\n';
                 }
 
-                // 4. РЕКУРСИЯ
-                // Если элемент - это просто контейнер без текста, мы не выводим его строку,
-                // но ОБЯЗАТЕЛЬНО идем внутрь искать детей.
-                // Но если мы уже вывели строку (shouldShow=true), то дети будут с отступом.
-                // Если нет (shouldShow=false), то дети будут на том же уровне (flattening),
-                // чтобы не плодить пустые <div>.
-                
                 const childDepth = shouldShow ? depth + 1 : depth;
-                
                 for (const child of element.children) {
                     output += traverse(child, childDepth);
                 }
+            }
+
+            cache.set(element, {depth, rect, inside, out: output});
+            return output;
+        }
 
-                return output;
+        // ID от прошлых снимков (другим движком) не должны пересекаться с новыми
+        document.querySelectorAll('[data-r-id]').forEach(el => el.removeAttribute('data-r-id'));
+
+        window.__aiIndex = {
+            snapshot() {
+                onMutations(observer.takeRecords());
+                if (resized) cache = new WeakMap();
+                // Потомки прокрученного/раскрытого элемента сдвигаются или появляются -
+                // сброс цепочки предков заставляет их перепроверить свои прямоугольники
+                for (const el of touched) markDirty(el);
+                touched.clear();
+                resized = false;
+                return traverse(document.body, 0);
             }
+        };
+    }
 
-            const structure = traverse(document.body, 0);
-            
-            if (!structure.trim()) return "Page seems empty (Scripts loading?). Wait...";
-            
-            return `URL: ${window.location.href}\\nSCROLL: ${window.scrollY}\\n\\n${structure}`;
-        }''')
+    const structure = window.__aiIndex.snapshot();
+    if (!structure.trim()) return "Page seems empty (Scripts loading?). Wait...";
+    return `URL: ${window.location.href}\\nSCROLL: ${window.scrollY}\\n\\n${structure}`;
+}'''
+
+
+SNAPSHOT_ENGINES = {
+    "index": INDEX_SNAPSHOT_JS,
+    "fast": FAST_SNAPSHOT_JS,
+    "legacy": LEGACY_SNAPSHOT_JS,
+}
+# Все движки, включая "ax" (дерево доступности через CDP, см. ax_snapshot.py)
+ENGINES = (*SNAPSHOT_ENGINES, "ax")
+
+
+def split_snapshot(tree: str):
+    """Разделить снимок на заголовок (URL, SCROLL) и строки дерева"""
+    head, sep, body = tree.partition("\n\n")
+    if not sep: return tree, []
+    return head, [l for l in body.split("\n") if l.strip()]
+
+
+def task_words(task: str) -> set:
+    return {w.lower() for w in WORD_RE.findall(task or "")}
+
+
+def score_line(line: str, top, viewport_h: float, words: set) -> float:
+    """Ценность строки: интерактивность + положение на экране + пересечение с задачей"""
+    score = 0.0
+    if ID_LINE_RE.match(line):
+        score += 3
+        tag = TAG_RE.search(line)
+        if tag and tag.group(1) in INPUT_TAGS: score += 1
+    if top is not None:
+        if 0 <= top <= viewport_h: score += 2
+        elif -200 <= top <= viewport_h * 2: score += 1
+    if words:
+        score += 2 * min(len(words & task_words(line)), 3)
+    return score
+
+
+def index_lines(lines) -> dict:
+    """Ключ строки: ID элемента, а для текста - сам текст с номером повтора"""
+    keyed, seen = {}, {}
+    for line in lines:
+        m = ID_LINE_RE.match(line)
+        if m:
+            key = "id:" + m.group(1)
+        else:
+            text = line.strip()
+            seen[text] = seen.get(text, 0) + 1
+            key = f"txt:{text}#{seen[text]}"
+        keyed[key] = line
+    return keyed
+
+
+class PageAnalyzer:
+    def __init__(self, page: Page, engine: str = SNAPSHOT_ENGINE, metrics=None):
+        self.page = page
+        self.engine = engine
+        self.metrics = metrics  # TaskMetrics задачи (глобальные гистограммы пишутся всегда)
+        self._prev = None  # последний отданный модели снимок: url, doc, step, строки
+        self._folds = {}   # свернутые при урезании по бюджету участки: F1 -> строки
+        self._fold_seq = 0
+        self._ax = AXSnapshot(page) if engine == "ax" else None
+
+    def reset(self):
+        """Забыть прошлый снимок - следующий будет полным"""
+        self._prev = None
+
+    def expand_fold(self, fold_id: str) -> dict:
+        """Развернуть свернутый участок прошлого снимка"""
+        lines = self._folds.get(fold_id.strip("[]").upper())
+        if lines is None: return {"success": False, "error": f"Unknown fold: {fold_id}"}
+        return {"success": True, "content": "\n".join(lines)}
+
+    async def get_snapshot(self, step: int = 0, full: bool = False, budget: int = None, task: str = "") -> dict:
+        """
+        Снимок для модели: полный, "без изменений" или дельта относительно
+        прошлого снимка (по ID элементов). После навигации - всегда полный.
+        Полный снимок сверх бюджета токенов урезается по релевантности к задаче.
+        """
+        budget = SNAPSHOT_TOKEN_BUDGET if budget is None else budget
+        doc = await self.page.evaluate(DOC_TOKEN_JS)
+        tree = await self.get_compact_state()
+        head, lines = split_snapshot(tree)
+        keyed = index_lines(lines)
+        url = self.page.url
+
+        prev = self._prev
+        self._prev = {"url": url, "doc": doc, "step": step, "lines": keyed}
+
+        # Дельты имеют смысл только при стабильных ID (движки index и ax)
+        if (full or prev is None or self.engine not in STABLE_ID_ENGINES or not lines
+                or prev["url"] != url or prev["doc"] != doc):
+            return {"content": await self._fit_budget(tree, head, lines, budget, task), "snapshot": "full"}
+
+        old = prev["lines"]
+        added = [keyed[k] for k in keyed if k not in old]
+        removed = [old[k] for k in old if k not in keyed]
+        changed = [keyed[k] for k in keyed if k in old and k.startswith("id:") and keyed[k].strip() != old[k].strip()]
+
+        if not (added or removed or changed):
+            return {"content": f"{head}\n\nPage unchanged since step {prev['step']}.", "snapshot": "unchanged"}
+
+        delta = [f"Changes since step {prev['step']} (+{len(added)} -{len(removed)} ~{len(changed)}). Other elements are unchanged."]
+        delta += ["+ " + l.strip() for l in added]
+        delta += ["- " + l.strip() for l in removed]
+        delta += ["~ " + l.strip() for l in changed]
+        delta_text = "\n".join(delta)
+
+        # Если изменилась большая часть страницы, полный снимок понятнее модели
+        if len(delta_text) > len(tree) * SNAPSHOT_DELTA_MAX_RATIO or (budget and estimate_tokens(delta_text) > budget):
+            return {"content": await self._fit_budget(tree, head, lines, budget, task), "snapshot": "full"}
+        return {"content": f"{head}\n\n{delta_text}", "snapshot": "delta"}
+
+    async def _fit_budget(self, tree: str, head: str, lines: list, budget: int, task: str) -> str:
+        """
+        Оставить самые полезные строки в пределах бюджета, а пропущенные
+        подряд идущие строки свернуть в плейсхолдеры [F<n>], которые модель
+        может развернуть через get_page_content(expand="F<n>").
+        """
+        if not budget or estimate_tokens(tree) <= budget: return tree
+
+        viewport_h, tops = await self.page.evaluate(POSITIONS_JS)
+        words = task_words(task)
+
+        # Блок = интерактивный элемент и текст под ним до следующего элемента.
+        # Ранжируем блоками, чтобы не дробить снимок на сотни мелких свертков
+        blocks, top = [], None
+        for i, line in enumerate(lines):
+            m = ID_LINE_RE.match(line)
+            if m:
+                top = tops.get(m.group(1), top)
+            if m or not blocks:
+                blocks.append({"lines": [], "score": 0.0, "cost": 0})
+            block = blocks[-1]
+            block["lines"].append(i)
+            block["score"] = max(block["score"], score_line(line, top, viewport_h, words))
+            block["cost"] += estimate_tokens(line)
+        order = sorted(range(len(blocks)), key=lambda b: (-blocks[b]["score"], b))
+
+        def select(limit):
+            keep, remaining = set(), limit
+            for b in order:
+                if blocks[b]["cost"] > remaining: continue
+                keep.update(blocks[b]["lines"])
+                remaining -= blocks[b]["cost"]
+            return keep
+
+        # Плейсхолдеры тоже стоят токенов: бинарным поиском подбираем отбор,
+        # при котором итоговый текст укладывается в бюджет
+        target = budget - estimate_tokens(head) - 20
+        lo, hi = 0, target
+        keep, body, folds = set(), *self._render_folded(lines, set())
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            cand = select(mid)
+            cand_body, cand_folds = self._render_folded(lines, cand)
+            if estimate_tokens(cand_body) <= target:
+                keep, body, folds = cand, cand_body, cand_folds
+                lo = mid + 1
+            else:
+                hi = mid - 1
+
+        self._store_folds(folds)
+        note = f"Snapshot trimmed to ~{budget} tokens: {len(lines) - len(keep)} of {len(lines)} lines folded."
+        return f"{head}\n{note}\n\n{body}"
+
+    def _render_folded(self, lines: list, keep: set):
+        out, hidden, folds = [], [], []
+        for i, line in enumerate(lines + [None]):
+            if line is not None and i not in keep:
+                hidden.append(line)
+                continue
+            if hidden:
+                fold_id = f"F{self._fold_seq + len(folds) + 1}"
+                folds.append((fold_id, hidden))
+                indent = hidden[0][:len(hidden[0]) - len(hidden[0].lstrip())]
+                out.append(f"{indent}… [{fold_id}: {len(hidden)} lines, {hidden[0].strip()[:30]}]")
+                hidden = []
+            if line is not None: out.append(line)
+        return "\n".join(out), folds
+
+    def _store_folds(self, folds: list):
+        for fold_id, hidden in folds:
+            self._folds[fold_id] = hidden
+        self._fold_seq += len(folds)
+        while len(self._folds) > MAX_FOLDS:
+            self._folds.pop(next(iter(self._folds)))
+
+    async def get_compact_state(self) -> str:
+        started = time.monotonic()
+        if self._ax: tree = await self._ax.snapshot()
+        else: tree = await self.page.evaluate(SNAPSHOT_ENGINES[self.engine])
+        elapsed = time.monotonic() - started
+        if self.metrics:
+            self.metrics.observe(SNAPSHOT_DURATION, elapsed, engine=self.engine)
+            self.metrics.observe(SNAPSHOT_SIZE, len(tree), engine=self.engine)
+        else:
+            SNAPSHOT_DURATION.observe(elapsed, engine=self.engine)
+            SNAPSHOT_SIZE.observe(len(tree), engine=self.engine)
 
         # Сохраняем дамп, чтобы ты мог проверить
         if DEBUG_MODE:
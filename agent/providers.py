@@ -0,0 +1,43 @@
+"""
+Ленивая загрузка SDK провайдеров LLM.
+Импорт google.genai и openai - заметная доля старта процесса, а нужны они
+только к первому запросу модели (при воспроизведении кассеты - вовсе не нужны).
+Сервер прогревает их в фоне; готовность видна в status().
+"""
+import importlib
+import time
+
+from config import GOOGLE_API_KEY, OPENAI_API_KEY, LLM_CASSETTE_MODE
+
+SDK_MODULES = {"gemini": "google.genai", "openai": "openai"}
+API_KEYS = {"gemini": GOOGLE_API_KEY, "openai": OPENAI_API_KEY}
+
+# Время импорта SDK, мс (есть только у загруженных)
+LOAD_MS = {}
+
+
+def sdk(provider: str):
+    """Модуль SDK провайдера; первый вызов импортирует его"""
+    started = time.perf_counter()
+    module = importlib.import_module(SDK_MODULES[provider])
+    LOAD_MS.setdefault(provider, int((time.perf_counter() - started) * 1000))
+    return module
+
+
+def genai_types():
+    sdk("gemini")
+    return importlib.import_module("google.genai.types")
+
+
+def load():
+    """Импортировать SDK всех настроенных провайдеров (прогрев, вызывается в отдельном потоке)"""
+    for provider, key in API_KEYS.items():
+        if key: sdk(provider)
+
+
+def status() -> dict:
+    providers = {name: {"configured": bool(API_KEYS[name]), "loaded": name in LOAD_MS, "load_ms": LOAD_MS.get(name)}
+                 for name in SDK_MODULES}
+    # При воспроизведении кассеты сеть и SDK не нужны
+    ready = LLM_CASSETTE_MODE == "replay" or any(p["configured"] and p["loaded"] for p in providers.values())
+    return {"ready": ready, **providers}
@@ -0,0 +1,128 @@
+"""
+Очередь задач - параллельное выполнение нескольких задач агента.
+Каждая задача получает свою вкладку из пула BrowserController,
+число одновременно работающих задач ограничено.
+"""
+import asyncio
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional
+
+from .ai_agent import AIAgent, reported_success
+from .browser_controller import BrowserController
+from .events import EventBus
+from config import MAX_CONCURRENT_TASKS, FAST_MODE
+
+MAX_FINISHED_TASKS = 100
+
+
+@dataclass
+class Task:
+    """Задача в очереди"""
+    id: str
+    text: str
+    log: Callable
+    events: EventBus
+    fast: bool = FAST_MODE  # быстрый режим: без картинок, шрифтов, видео и трекеров
+    status: str = "queued"  # queued | running | done | stopped | failed
+    agent: Optional[AIAgent] = None
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "task_id": self.id, "task": self.text, "status": self.status, "fast": self.fast,
+            "paused": bool(self.agent and self.agent.paused), "seq": self.events.seq,
+            "created": self.created, "started": self.started, "finished": self.finished,
+        }
+
+
+class TaskQueue:
+    """Очередь задач с ограничением параллельности"""
+
+    def __init__(self, browser: BrowserController, concurrency: int = MAX_CONCURRENT_TASKS, agent_factory=AIAgent,
+                 ready: asyncio.Event = None):
+        self.browser = browser
+        self.agent_factory = agent_factory
+        # Браузер может еще запускаться: задачи принимаются сразу и ждут в очереди
+        self.ready = ready
+        self.tasks: Dict[str, Task] = {}
+        self._slots = asyncio.Semaphore(concurrency)
+
+    def submit(self, text: str, log_callback: Callable = None, fast: bool = None) -> Task:
+        """
+        Поставить задачу в очередь; выполнение начнется, когда освободится слот.
+        Без log_callback события задачи идут в ее шину (task.events)
+        """
+        task_id = uuid.uuid4().hex[:8]
+        events = EventBus(task_id)
+        task = Task(id=task_id, text=text, log=log_callback or events.publish, events=events,
+                    fast=FAST_MODE if fast is None else fast)
+        self.tasks[task.id] = task
+        self._prune()
+        asyncio.create_task(self._run(task))
+        return task
+
+    async def _run(self, task: Task):
+        if self.ready: await self.ready.wait()
+        async with self._slots:
+            if task.status != "queued": return
+            try:
+                tab = await self.browser.acquire_tab()
+            except Exception as e:
+                # Браузер не запустился: задача не должна навсегда остаться в очереди
+                task.status, task.finished = "failed", time.time()
+                await task.log("error", f"Браузер недоступен: {e}")
+                return
+            try:
+                await tab.set_fast_mode(task.fast)
+                task.agent = self.agent_factory(tab, log_callback=task.log)
+                task.agent.task_id = task.id
+                task.status = "running"
+                task.started = time.time()
+                await task.agent.execute_task(task.text)
+                # Как в журнале: итог задачи - по report_result агента, а не по тому, что цикл завершился
+                if task.status == "running":
+                    result = task.agent.result
+                    task.status = "done" if result and reported_success(result) else "failed"
+            except Exception as e:
+                task.status = "failed"
+                await task.log("error", f"Ошибка задачи: {e}")
+            finally:
+                task.finished = time.time()
+                self.browser.release_tab(tab)
+
+    def _prune(self):
+        finished = [t.id for t in self.tasks.values() if t.status not in ("queued", "running")]
+        for task_id in finished[:-MAX_FINISHED_TASKS]:
+            del self.tasks[task_id]
+
+    def get(self, task_id: str = None) -> Optional[Task]:
+        """Задача по ID; без ID - последняя поставленная"""
+        if task_id: return self.tasks.get(task_id)
+        return next(reversed(self.tasks.values()), None)
+
+    def stop(self, task_id: str = None) -> Optional[Task]:
+        """Остановить задачу; None, если останавливать нечего (нет такой или уже завершена)"""
+        task = self.get(task_id)
+        if not task or task.status not in ("queued", "running"): return None
+        if task.agent: task.agent.stop()
+        task.status = "stopped"
+        task.finished = time.time()
+        return task
+
+    def pause(self, task_id: str = None, paused: bool = True) -> Optional[Task]:
+        task = self.get(task_id)
+        if task and task.agent: task.agent.paused = paused
+        return task
+
+    def active(self):
+        return [t for t in self.tasks.values() if t.status in ("queued", "running")]
+
+    def status(self) -> dict:
+        return {
+            "is_running": bool(self.active()),
+            "tasks": [t.to_dict() for t in self.tasks.values()],
+        }
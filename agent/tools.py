@@ -76,10 +76,14 @@ TOOLS = [
     },
     {
         "name": "get_page_content",
-        "description": "Get page content and elements. ALWAYS use this first!",
+        "description": "Get page content and elements. ALWAYS use this first! Repeated calls on the same page return only changes since the previous snapshot",
         "parameters": {
             "type": "object",
-            "properties": {}
+            "properties": {
+                "full": {"type": "boolean", "description": "Force a full snapshot instead of changes"},
+                "max_tokens": {"type": "number", "description": "Token budget for the snapshot; less relevant parts are folded"},
+                "expand": {"type": "string", "description": "Fold ID like F3 to show its hidden lines"}
+            }
         }
     },
     {
@@ -145,6 +149,35 @@ TOOLS = [
             "required": ["finding"]
         }
     },
+    {
+        "name": "run_actions",
+        "description": "Run a sequence of page actions in one step (e.g. fill a whole form). Stops at the first failed action",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "actions": {
+                    "type": "string",
+                    "description": 'JSON array of {"tool": name, "args": {...}}, e.g. [{"tool": "type_text", "args": {"selector": "[3]", "text": "Москва"}}, {"tool": "press_key", "args": {"key": "Enter"}}]'
+                }
+            },
+            "required": ["actions"]
+        }
+    },
+    {
+        "name": "spawn_agents",
+        "description": "Run independent sub-tasks in parallel, each by a separate agent in its own tab (e.g. check the same item on several sites). Returns their report_result outputs",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "tasks": {
+                    "type": "string",
+                    "description": 'JSON array of sub-tasks: strings or {"task": text, "max_steps": number}, e.g. ["Найди цену iPhone 15 на ozon.ru", "Найди цену iPhone 15 на wildberries.ru"]'
+                },
+                "max_steps": {"type": "number", "description": "Step budget for each sub-agent"}
+            },
+            "required": ["tasks"]
+        }
+    },
     {
         "name": "report_result",
         "description": "Report final result",
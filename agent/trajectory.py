@@ -0,0 +1,126 @@
+"""
+Траектории - запись успешных прогонов и их повтор без LLM.
+Каждый успешный execute_task сохраняется как список вызовов инструментов
+с отпечатками элементов. Та же задача на том же домене повторяется
+напрямую через _execute_tool с проверкой каждого шага по странице.
+После повтора (или при расхождении) управление возвращается модели:
+итог задачи она дает по текущей странице, а не из записи.
+"""
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Optional
+from urllib.parse import urlparse
+
+from config import TRAJECTORY_FILE
+
+# Инструменты, которые записываются в траекторию (остальные - чтение страницы и мета)
+RECORDED_TOOLS = ("navigate", "click", "type_text", "fill", "press_key", "scroll", "go_back")
+
+# Отпечаток элемента, на который ссылается [ID]: по нему элемент ищется при повторе
+FINGERPRINT_JS = """(id) => {
+    const el = document.querySelector(`[data-r-id="${id}"]`);
+    if (!el) return null;
+    const clean = t => (t || '').replace(/\\s+/g, ' ').trim().substring(0, 100);
+    return {
+        tag: el.tagName.toLowerCase(),
+        text: clean(el.innerText || el.value),
+        label: clean(el.getAttribute('aria-label') || el.getAttribute('title') || el.getAttribute('placeholder')),
+        name: el.getAttribute('name') || '',
+        type: el.getAttribute('type') || '',
+        href: el.getAttribute('href') || '',
+    };
+}"""
+
+# Поиск видимого элемента по отпечатку; возвращает его data-r-id (назначает, если нет)
+FIND_BY_FINGERPRINT_JS = """(fp) => {
+    const clean = t => (t || '').replace(/\\s+/g, ' ').trim().substring(0, 100);
+    for (const el of document.querySelectorAll(fp.tag)) {
+        const rect = el.getBoundingClientRect();
+        if (rect.width < 1 || rect.height < 1) continue;
+        if (clean(el.innerText || el.value) !== fp.text && !(fp.tag === 'input' || fp.tag === 'textarea')) continue;
+        const label = clean(el.getAttribute('aria-label') || el.getAttribute('title') || el.getAttribute('placeholder'));
+        if (label !== fp.label || (el.getAttribute('name') || '') !== fp.name || (el.getAttribute('type') || '') !== fp.type) continue;
+        if (fp.href && (el.getAttribute('href') || '') !== fp.href) continue;
+        let id = el.getAttribute('data-r-id');
+        if (!id) { id = 'r' + Math.random().toString(36).slice(2, 8); el.setAttribute('data-r-id', id); }
+        return id;
+    }
+    return null;
+}"""
+
+ID_SELECTOR_RE = re.compile(r"^\[(\w+)\]$")
+
+
+def normalize_task(task: str) -> str:
+    return re.sub(r"\s+", " ", (task or "").lower()).strip(" .!?")
+
+
+def domain_of(url: str) -> str:
+    return urlparse(url or "").hostname or ""
+
+
+def element_id(args: dict) -> Optional[str]:
+    """ID элемента из селектора вида [12]"""
+    m = ID_SELECTOR_RE.match(str(args.get("selector", "")).strip())
+    return m.group(1) if m else None
+
+
+class TrajectoryStore:
+    """Хранилище траекторий и статистики повторов (JSON-файл)"""
+
+    def __init__(self, path: str = TRAJECTORY_FILE):
+        self.path = path
+        self.data = {"trajectories": {}, "stats": {"lookups": 0, "hits": 0, "completed": 0, "diverged": 0, "time_saved": 0.0}}
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f: self.data = json.load(f)
+            except (OSError, ValueError): pass
+
+    @staticmethod
+    def key(task: str, domain: str) -> str:
+        return hashlib.sha1(f"{normalize_task(task)}|{domain}".encode("utf-8")).hexdigest()
+
+    def find(self, task: str, domain: str) -> Optional[dict]:
+        self.data["stats"]["lookups"] += 1
+        trajectory = self.data["trajectories"].get(self.key(task, domain))
+        if trajectory: self.data["stats"]["hits"] += 1
+        return trajectory
+
+    def save(self, task: str, domain: str, steps: list, duration: float, result: str):
+        self.data["trajectories"][self.key(task, domain)] = {
+            "task": task, "domain": domain, "steps": steps, "duration": duration,
+            "result": result, "recorded": time.time(),
+        }
+        self.flush()
+
+    def record_replay(self, completed: bool, time_saved: float = 0.0):
+        stats = self.data["stats"]
+        if completed:
+            stats["completed"] += 1
+            stats["time_saved"] += max(time_saved, 0.0)
+        else:
+            stats["diverged"] += 1
+        self.flush()
+
+    def stats(self) -> dict:
+        stats = dict(self.data["stats"])
+        stats["hit_rate"] = round(stats["hits"] / stats["lookups"], 3) if stats["lookups"] else 0.0
+        stats["time_saved"] = round(stats["time_saved"], 1)
+        stats["trajectories"] = len(self.data["trajectories"])
+        return stats
+
+    def flush(self):
+        try:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Trajectory store write failed: {e}")
+
+
+# Одно хранилище на процесс: его делят все агенты
+TRAJECTORIES = TrajectoryStore()
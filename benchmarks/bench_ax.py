@@ -0,0 +1,67 @@
+"""
+Бенчмарк движка "ax" (дерево доступности через CDP) против JS-обходов
+на одних и тех же страницах (headless Chromium). Для каждой страницы:
+время первого (холодного) и медиана повторных снимков, размер вывода,
+число интерактивных элементов и сколько из их ID находится в DOM
+через data-r-id (то есть пригодно для click/type_text).
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_ax
+    python -m benchmarks.bench_ax --engines fast ax --repeat 20
+"""
+import argparse
+import asyncio
+import glob
+import os
+import statistics
+import time
+
+from playwright.async_api import async_playwright
+
+from agent.ax_snapshot import AXSnapshot
+from agent.context_manager import estimate_tokens
+from agent.page_analyzer import ENGINES, ID_LINE_RE, SNAPSHOT_ENGINES
+
+BENCH_DIR = os.path.dirname(__file__)
+PAGES = sorted(glob.glob(os.path.join(BENCH_DIR, "fixtures", "*.html")) + glob.glob(os.path.join(BENCH_DIR, "sites", "*.html")))
+
+RESOLVE_JS = "ids => ids.filter(id => document.querySelector(`[data-r-id=\"${id}\"]`)).length"
+
+
+async def measure(page, engine, repeat):
+    """(холодный мс, медиана повторных мс, последний вывод)"""
+    ax = AXSnapshot(page) if engine == "ax" else None
+    samples, out = [], ""
+    for _ in range(repeat + 1):
+        started = time.perf_counter()
+        out = await ax.snapshot() if ax else await page.evaluate(SNAPSHOT_ENGINES[engine])
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples[0], statistics.median(samples[1:]), out
+
+
+async def run(pages, engines, repeat):
+    async with async_playwright() as pw:
+        browser = await pw.chromium.launch(headless=True)
+        print(f"{'page':<18} {'engine':<7} {'cold ms':>8} {'warm ms':>8} {'chars':>7} {'~tokens':>8} {'ids':>5} {'found':>6}")
+        for path in pages:
+            name = os.path.basename(path)
+            for engine in engines:
+                # Новая вкладка на каждый движок: кэши index и ax не должны мешать друг другу
+                page = await browser.new_page(viewport={"width": 1280, "height": 900})
+                await page.goto("file://" + os.path.abspath(path))
+                await page.wait_for_timeout(300)  # подгрузки фикстур (setTimeout) успевают отработать
+                cold, warm, out = await measure(page, engine, repeat)
+                ids = [m.group(1) for m in map(ID_LINE_RE.match, out.split("\n")) if m]
+                found = await page.evaluate(RESOLVE_JS, ids)
+                print(f"{name:<18} {engine:<7} {cold:>8.2f} {warm:>8.2f} {len(out):>7} {estimate_tokens(out):>8} {len(ids):>5} {found:>6}")
+                await page.close()
+        await browser.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", nargs="+", default=PAGES)
+    parser.add_argument("--engines", nargs="+", default=["fast", "index", "ax"], choices=sorted(ENGINES))
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(run(args.pages, args.engines, args.repeat))
@@ -0,0 +1,85 @@
+"""
+Бенчмарк снимка страницы: полный обход (legacy) против постоянного индекса.
+Генерирует большие синтетические витрины и меряет время get_compact_state
+на холодном вызове, повторном вызове без изменений и после точечных мутаций.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_dom_index --cards 500 2000 5000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from playwright.async_api import async_playwright
+
+from agent.page_analyzer import LEGACY_SNAPSHOT_JS, INDEX_SNAPSHOT_JS
+
+
+def make_storefront(cards: int) -> str:
+    """Витрина: шапка, фильтры и сетка карточек товаров с вложенными обертками"""
+    items = []
+    for i in range(cards):
+        items.append(
+            f'<div class="card"><div class="wrap"><div class="inner">'
+            f'<img src="data:," alt="Товар {i}" width="120" height="120">'
+            f'<a href="/item/{i}">Товар номер {i} с длинным названием</a>'
+            f'<div class="price"><span>{1000 + i} ₽</span></div>'
+            f'<button onclick="void 0">В корзину</button>'
+            f'</div></div></div>'
+        )
+    filters = "".join(f'<label><input type="checkbox"> Фильтр {i}</label>' for i in range(40))
+    return (
+        '<html><body style="margin:0">'
+        '<header><a href="/">Магазин</a><input placeholder="Поиск"><button>Найти</button></header>'
+        f'<aside>{filters}</aside>'
+        f'<main style="display:grid;grid-template-columns:repeat(4,1fr)">{"".join(items)}</main>'
+        '</body></html>'
+    )
+
+
+MUTATE_JS = """(n) => {
+    const prices = document.querySelectorAll('.price span');
+    for (let i = 0; i < n; i++) prices[i].textContent = (2000 + i) + ' ₽';
+}"""
+
+
+async def timed(page, script, repeat=1):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        out = await page.evaluate(script)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), len(out)
+
+
+async def run(cards_list, repeat):
+    async with async_playwright() as pw:
+        browser = await pw.chromium.launch(headless=True)
+        page = await browser.new_page(viewport={"width": 1280, "height": 900})
+        print(f"{'cards':>6} {'legacy ms':>10} {'index cold':>11} {'index warm':>11} {'index +10 muts':>15} {'chars':>8}")
+        for cards in cards_list:
+            await page.set_content(make_storefront(cards))
+            legacy_ms, size = await timed(page, LEGACY_SNAPSHOT_JS, repeat)
+
+            # Новый документ - индекс ставится заново
+            await page.set_content(make_storefront(cards))
+            cold_ms, _ = await timed(page, INDEX_SNAPSHOT_JS)
+            warm_ms, _ = await timed(page, INDEX_SNAPSHOT_JS, repeat)
+
+            mutated = []
+            for _ in range(repeat):
+                await page.evaluate(MUTATE_JS, 10)
+                ms, _ = await timed(page, INDEX_SNAPSHOT_JS)
+                mutated.append(ms)
+
+            print(f"{cards:>6} {legacy_ms:>10.1f} {cold_ms:>11.1f} {warm_ms:>11.1f} {statistics.median(mutated):>15.1f} {size:>8}")
+        await browser.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cards", type=int, nargs="+", default=[500, 2000, 5000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.cards, args.repeat))
@@ -0,0 +1,62 @@
+"""
+Микробенчмарк кодирования истории под провайдеров: полное перекодирование
+на каждом ходу (как раньше) против кэша кодировок (EncodingCache).
+История растет по шагу за ход до 60 шагов; каждый шаг - мысль, вызов
+инструмента и ответ с большим снимком страницы.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_encoding
+    python -m benchmarks.bench_encoding --steps 60 --snapshot-kb 40
+"""
+import argparse
+import json
+import os
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "bench-encoding")
+
+from agent.ai_agent import AIAgent
+from agent.messages import EncodingCache
+
+
+def make_step(i: int, snapshot_kb: int) -> list:
+    line = "  [{n}] <a> \"Товар номер {n} - подробное описание\"\n"
+    snapshot = "".join(line.format(n=i * 1000 + n) for n in range(snapshot_kb * 1024 // len(line)))
+    call_id = f"call-{i}"
+    return [
+        {"role": "assistant", "content": f"Шаг {i}: смотрю страницу и выбираю следующий товар."},
+        {"role": "assistant", "tool_calls": [{"id": call_id, "name": "get_page_content", "args": {}}]},
+        {"role": "tool", "tool_call_id": call_id, "name": "get_page_content",
+         "content": json.dumps({"success": True, "content": snapshot, "snapshot": "full"}, ensure_ascii=False)},
+    ]
+
+
+def run(encode, steps: int, snapshot_kb: int, cached: bool):
+    """Суммарное время кодирования за все ходы и время последнего хода, мс"""
+    cache = EncodingCache(encode)
+    history = [{"role": "user", "content": "Task: собери корзину из 60 товаров"}]
+    total, last = 0.0, 0.0
+    for i in range(steps):
+        history += make_step(i, snapshot_kb)
+        started = time.perf_counter()
+        if cached: cache.encode_history(history)
+        else: [encode(m) for m in history]
+        last = (time.perf_counter() - started) * 1000
+        total += last
+    return total, last, cache
+
+
+def main(args):
+    print(f"{'provider':<8} {'mode':<8} {'total ms':>10} {'last turn ms':>13} {'encoded':>8}")
+    for provider, encode in (("gemini", AIAgent._gemini_message), ("openai", AIAgent._openai_message)):
+        for cached in (False, True):
+            total, last, cache = run(encode, args.steps, args.snapshot_kb, cached)
+            encoded = cache.misses if cached else sum(range(4, 3 * args.steps + 2, 3))
+            print(f"{provider:<8} {'cache' if cached else 'full':<8} {total:>10.1f} {last:>13.2f} {encoded:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", type=int, default=60)
+    parser.add_argument("--snapshot-kb", type=int, default=20)
+    main(parser.parse_args())
@@ -0,0 +1,94 @@
+"""
+Бенчмарк подзадач (spawn_agents): задача "узнать цену на N сайтах"
+одним агентом сайт за сайтом против дочерних агентов на своих вкладках.
+Модель и вкладки фейковые (как в load_test), цикл AIAgent настоящий.
+При параллельном запуске время должно определяться самым медленным
+сайтом, а не суммой всех.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_fanout --sites 1 2 3 5 --steps 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "bench-fanout")
+
+from agent.ai_agent import AIAgent
+from benchmarks.e2e import ScratchStore, scratch_journal
+from benchmarks.load_test import FakeTab, noop_log
+from config import SUBAGENT_CONCURRENCY
+
+
+class FanoutTab(FakeTab):
+    """Фейковая вкладка, которая умеет открывать соседние вкладки"""
+
+    async def _open_tab(self):
+        return FanoutTab(self.action_latency)
+
+    async def close_tab(self):
+        pass
+
+
+class SiteAgent(AIAgent):
+    """
+    Сценарий вместо модели. Задача - "Цены: a.example, b.example": на каждом
+    сайте переход и несколько кликов. В режиме fanout родитель отдает сайты
+    подзадачам одним вызовом spawn_agents.
+    """
+    llm_latency = 0.2
+    steps = 3
+    fanout = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.trajectories = ScratchStore()
+
+    async def _call_llm_with_fallback(self, history, **stream):
+        await asyncio.sleep(self.llm_latency)
+        sites = [s.strip() for s in self.context.task.split(":", 1)[1].split(",")]
+        done = sum(1 for m in history if m.get("role") == "tool")
+        if self.fanout and self.can_spawn:
+            if done == 0:
+                tasks = json.dumps([f"Цены: {site}" for site in sites])
+                return self._call("spawn", "spawn_agents", {"tasks": tasks})
+        elif done < len(sites) * (1 + self.steps):
+            site, action = divmod(done, 1 + self.steps)
+            if action == 0: return self._call(f"n{done}", "navigate", {"url": sites[site]})
+            return self._call(f"c{done}", "click", {"selector": "[1]"})
+        return self._call("end", "report_result", {"result": "ok", "success": True})
+
+    @staticmethod
+    def _call(call_id, name, args):
+        return {"content": "", "tool_calls": [{"id": call_id, "name": name, "args": args}]}
+
+
+async def run_once(sites: int, fanout: bool, args) -> float:
+    agent_cls = type("Agent", (SiteAgent,), {"fanout": fanout, "steps": args.steps, "llm_latency": args.llm_latency})
+    agent = agent_cls(FanoutTab(args.action_latency), log_callback=noop_log)
+    started = time.perf_counter()
+    await agent.execute_task("Цены: " + ", ".join(f"shop{i}.example" for i in range(1, sites + 1)))
+    assert agent.result and agent.result.get("success"), agent.result
+    return time.perf_counter() - started
+
+
+async def main(args):
+    scratch_journal()
+    print(f"Шагов на сайт: {1 + args.steps}, LLM {args.llm_latency * 1000:.0f} мс, действие {args.action_latency * 1000:.0f} мс, "
+          f"подзадач одновременно: {SUBAGENT_CONCURRENCY}")
+    print(f"{'sites':>5} {'sequential s':>13} {'fan-out s':>10} {'speedup':>8}")
+    for sites in args.sites:
+        sequential = await run_once(sites, False, args)
+        fanout = await run_once(sites, True, args)
+        print(f"{sites:>5} {sequential:>13.2f} {fanout:>10.2f} {sequential / fanout:>7.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sites", type=int, nargs="+", default=[1, 2, 3, 5])
+    parser.add_argument("--steps", type=int, default=3, help="кликов на сайте после перехода")
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--action-latency", type=float, default=0.1)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,62 @@
+"""
+Бенчмарк движков обхода DOM на сохраненных HTML-фикстурах (headless Chromium).
+Для каждой фикстуры меряет время и размер вывода legacy и fast, а также
+проверяет, что fast дает байт-в-байт тот же снимок.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_snapshot
+    python -m benchmarks.bench_snapshot --fixtures benchmarks/fixtures/form.html --repeat 20
+"""
+import argparse
+import asyncio
+import glob
+import os
+import statistics
+import sys
+import time
+
+from playwright.async_api import async_playwright
+
+from agent.page_analyzer import SNAPSHOT_ENGINES
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+async def measure(page, script, repeat):
+    samples, out = [], ""
+    for _ in range(repeat):
+        started = time.perf_counter()
+        out = await page.evaluate(script)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), out
+
+
+async def run(fixtures, engines, repeat) -> bool:
+    identical = True
+    async with async_playwright() as pw:
+        browser = await pw.chromium.launch(headless=True)
+        page = await browser.new_page(viewport={"width": 1280, "height": 900})
+        print(f"{'fixture':<20} {'engine':<8} {'median ms':>10} {'chars':>8}")
+        for path in fixtures:
+            name = os.path.basename(path)
+            await page.goto("file://" + os.path.abspath(path))
+            outputs = {}
+            for engine in engines:
+                ms, out = await measure(page, SNAPSHOT_ENGINES[engine], repeat)
+                outputs[engine] = out
+                print(f"{name:<20} {engine:<8} {ms:>10.2f} {len(out):>8}")
+            if "legacy" in outputs and "fast" in outputs and outputs["legacy"] != outputs["fast"]:
+                identical = False
+                print(f"!! {name}: fast output differs from legacy")
+        await browser.close()
+    return identical
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", nargs="+", default=sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.html"))))
+    parser.add_argument("--engines", nargs="+", default=["legacy", "fast"], choices=sorted(SNAPSHOT_ENGINES))
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+    ok = asyncio.run(run(args.fixtures, args.engines, args.repeat))
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,113 @@
+"""
+Бенчмарк старта: сколько стоит импорт модулей (каждый - в чистом
+интерпретаторе) и как быстро сервер начинает принимать подключения
+и становится готов к задачам (/ready). Браузер запускается без окна.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --repeat 5 --port 8765
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+IMPORTS = ("agent.ai_agent", "google.genai", "openai", "server")
+
+IMPORT_SCRIPT = """
+import sys, time
+started = time.perf_counter()
+import {module}
+print(round((time.perf_counter() - started) * 1000), "google.genai" in sys.modules, "openai" in sys.modules)
+"""
+
+
+def bench_env() -> dict:
+    env = dict(os.environ, HEADLESS="True")
+    env.setdefault("GOOGLE_API_KEY", "bench-startup")  # иначе прогревать нечего
+    return env
+
+
+def import_ms(module: str):
+    """(мс, загружен ли google.genai, загружен ли openai) или None, если модуль не импортируется"""
+    proc = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT.format(module=module)], env=bench_env(),
+                          capture_output=True, text=True)
+    if proc.returncode != 0: return None
+    ms, genai, openai = proc.stdout.split()[-3:]
+    return int(ms), genai == "True", openai == "True"
+
+
+def get_ready(port: int):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=1) as resp:
+            return json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        return json.loads(e.read())  # 503 - сервер отвечает, но еще греется
+
+
+def server_startup(port: int, timeout: float) -> dict:
+    """Время до первого ответа сервера и до готовности браузера и провайдеров, мс"""
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+                            env=bench_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    out = {"accepting": None, "browser": None, "ready": None, "error": None}
+    try:
+        while time.perf_counter() - started < timeout:
+            if proc.poll() is not None:
+                out["error"] = f"server exited with code {proc.returncode}"
+                break
+            try: status = get_ready(port)
+            except (OSError, ValueError):
+                time.sleep(0.02)
+                continue
+            now = int((time.perf_counter() - started) * 1000)
+            out["accepting"] = out["accepting"] or now
+            if status["browser"]["error"]:
+                out["error"] = status["browser"]["error"]
+                break
+            if status["browser"]["ready"]: out["browser"] = out["browser"] or now
+            if status["ready"]:
+                out["ready"] = now
+                break
+            time.sleep(0.02)
+    finally:
+        proc.terminate()
+        try: proc.wait(timeout=10)
+        except subprocess.TimeoutExpired: proc.kill()
+    return out
+
+
+def median(values):
+    values = [v for v in values if v is not None]
+    return f"{statistics.median(values):.0f}" if values else "n/a"
+
+
+def main(args):
+    print("Импорт в чистом интерпретаторе, мс (медиана):")
+    for module in IMPORTS:
+        runs = [import_ms(module) for _ in range(args.repeat)]
+        if not all(runs):
+            print(f"  {module:<16} не импортируется (нет зависимостей?)")
+            continue
+        _, genai, openai = runs[0]
+        print(f"  {module:<16} {median([r[0] for r in runs]):>6}   SDK загружены: google.genai={genai}, openai={openai}")
+
+    print("\nСтарт сервера, мс (медиана):")
+    runs = [server_startup(args.port, args.timeout) for _ in range(args.repeat)]
+    for key, label in (("accepting", "принимает подключения"), ("browser", "браузер запущен"), ("ready", "/ready = true")):
+        print(f"  {label:<24} {median([r[key] for r in runs]):>6}")
+    errors = {r["error"] for r in runs if r["error"]}
+    if errors: print("  ошибки:", "; ".join(errors))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=60.0, help="сколько ждать готовности сервера, сек")
+    main(parser.parse_args())
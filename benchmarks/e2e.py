@@ -0,0 +1,310 @@
+"""
+Сквозной офлайн-бенчмарк агента: локальные сайты-фикстуры (поиск, сетка
+товаров, многошаговая форма, бесконечная лента) раздаются встроенным
+HTTP-сервером, а вместо Gemini/OpenAI работает сценарий - заранее
+записанная последовательность вызовов инструментов. Меряется только
+сторона агента: время задачи, время шага и стоимость снимков страницы.
+
+Цели в сценариях задаются текстом ("@Найти"): ID элемента ищется в
+последних снимках get_page_content, как это сделала бы модель.
+
+Запуск из корня проекта:
+    python -m benchmarks.e2e --repeat 3 --out bench_e2e.json
+    python -m benchmarks.e2e --engine legacy --baseline bench_e2e.json
+    python -m benchmarks.e2e --compare old.json new.json --threshold 0.2
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+os.environ.setdefault("GOOGLE_API_KEY", "e2e-bench")
+
+from playwright.async_api import async_playwright
+
+from agent.ai_agent import AIAgent
+from agent.browser_controller import BrowserController
+from agent.journal import JOURNAL
+from agent.metrics import ITERATION_DURATION, SNAPSHOT_DURATION, SNAPSHOT_SIZE, SLEEP_DURATION
+from agent.page_analyzer import PageAnalyzer, ENGINES, ID_LINE_RE
+from agent.trajectory import TrajectoryStore
+from config import SNAPSHOT_ENGINE, VIEWPORT
+
+SITES_DIR = os.path.join(os.path.dirname(__file__), "sites")
+
+# Сценарий: задача, шаги (инструмент, аргументы) и проверка результата на странице
+SCENARIOS = {
+    "search": {
+        "task": "Найди ноутбук Lenovo и открой его карточку",
+        "steps": [
+            ("navigate", {"url": "{base}/search.html"}),
+            ("get_page_content", {}),
+            ("type_text", {"selector": "@Поиск товаров", "text": "ноутбук"}),
+            ("press_key", {"key": "Enter"}),
+            ("get_page_content", {}),
+            ("click", {"selector": "@Ноутбук Lenovo"}),
+        ],
+        "check": "() => document.getElementById('detail-title').textContent.includes('Lenovo')",
+    },
+    "grid": {
+        "task": "Добавь в корзину чайник Bosch 100 и утюг Bosch 105",
+        "steps": [
+            ("navigate", {"url": "{base}/grid.html"}),
+            ("get_page_content", {}),
+            ("click", {"selector": "@В корзину: Чайник Bosch 100"}),
+            ("click", {"selector": "@В корзину: Утюг Bosch 105"}),
+            ("get_page_content", {}),
+        ],
+        "check": "() => document.getElementById('cart').textContent === '2'",
+    },
+    "form": {
+        "task": "Оформи заказ на Ивана Петрова с доставкой в Казань, оплата картой",
+        "steps": [
+            ("navigate", {"url": "{base}/form.html"}),
+            ("get_page_content", {}),
+            ("type_text", {"selector": "@Имя получателя", "text": "Иван Петров"}),
+            ("type_text", {"selector": "@Email", "text": "ivan@example.com"}),
+            ("click", {"selector": "@Далее"}),
+            ("get_page_content", {}),
+            ("type_text", {"selector": "@Город", "text": "Казань"}),
+            ("type_text", {"selector": "@Улица, дом", "text": "ул. Баумана, 1"}),
+            ("click", {"selector": "@К оплате"}),
+            ("get_page_content", {}),
+            ("click", {"selector": "@Оплата картой"}),
+            ("click", {"selector": "@Подтвердить заказ"}),
+        ],
+        "check": "() => !document.getElementById('done').hidden",
+    },
+    "scroll": {
+        "task": "Пролистай ленту и открой статью #30",
+        "steps": [
+            ("navigate", {"url": "{base}/scroll.html"}),
+            ("get_page_content", {}),
+            ("scroll", {"direction": "down"}),
+            ("scroll", {"direction": "down"}),
+            ("scroll", {"direction": "down"}),
+            ("scroll", {"direction": "down"}),
+            ("get_page_content", {}),
+            ("click", {"selector": "@Статья #30\""}),
+        ],
+        "check": "() => document.getElementById('opened').textContent === 'Открыта статья #30'",
+    },
+}
+
+# Метрики, по которым сравниваются прогоны (больше - хуже)
+COMPARED = ("wall_s", "step_ms", "snapshot_ms", "snapshot_chars", "settle_ms")
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_sites() -> ThreadingHTTPServer:
+    """Локальный сервер фикстур на свободном порту"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=SITES_DIR))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class BenchBrowser(BrowserController):
+    """Чистый headless Chromium без профиля и расширения"""
+
+    async def start(self):
+        self.playwright = await async_playwright().start()
+        browser = await self.playwright.chromium.launch(headless=True)
+        self.context = await browser.new_context(viewport=VIEWPORT, locale="ru-RU")
+        self.page = await self.context.new_page()
+        self.page.set_default_timeout(10000)
+        self._watch_page(self.page)
+        self._tabs = [self]
+        self._idle_tabs.put_nowait(self)
+        return self
+
+
+class ScratchStore(TrajectoryStore):
+    """Траектории бенчмарка не сохраняются и не повторяются: каждый прогон идет по сценарию"""
+
+    def __init__(self):
+        super().__init__(os.devnull)
+
+    def find(self, task, domain):
+        return None
+
+    def flush(self):
+        pass
+
+
+def scratch_journal():
+    """Журнал прогонов бенчмарка - во временной папке, а не в ./journal.db с историей настоящих задач"""
+    JOURNAL.path = os.path.join(tempfile.mkdtemp(prefix="bench-journal-"), "journal.db")
+
+
+class ScriptedAgent(AIAgent):
+    """Агент, у которого модель заменена сценарием"""
+
+    def __init__(self, browser, log_callback, steps, base_url, engine=SNAPSHOT_ENGINE, llm_latency=0.0):
+        super().__init__(browser, log_callback)
+        self.steps = steps
+        self.base_url = base_url
+        self.llm_latency = llm_latency
+        self.cursor = 0
+        self.analyzer = PageAnalyzer(browser.page, engine=engine)
+        self.trajectories = ScratchStore()
+
+    async def _call_llm_with_fallback(self, history, **stream):
+        if self.llm_latency: await asyncio.sleep(self.llm_latency)
+        self.cursor += 1
+        if self.cursor > len(self.steps):
+            return self._tool_call("report_result", {"result": "Сценарий выполнен", "success": True})
+        name, args = self.steps[self.cursor - 1]
+        resolved = {}
+        for key, value in args.items():
+            value = value.replace("{base}", self.base_url)
+            if value.startswith("@"):
+                element = self._find_element(history, value[1:])
+                if not element:
+                    return self._tool_call("report_result", {"result": f"Не найден элемент: {value[1:]}", "success": False})
+                value = element
+            resolved[key] = value
+        return self._tool_call(name, resolved)
+
+    def _tool_call(self, name, args):
+        return {"content": "", "tool_calls": [{"id": f"step{self.cursor}", "name": name, "args": args}]}
+
+    @staticmethod
+    def _find_element(history, text):
+        """[ID] первой строки снимка с этим текстом - от свежих снимков к старым"""
+        for msg in reversed(history):
+            if msg.get("role") != "tool": continue
+            try: result = json.loads(msg["content"])
+            except ValueError: continue
+            # Снимок - ответ get_page_content или приложенный к действию page_content
+            content = result.get("content") if msg.get("name") == "get_page_content" else result.get("page_content")
+            if not content: continue
+            for line in content.splitlines():
+                m = ID_LINE_RE.match(line)
+                if m and text in line: return f"[{m.group(1)}]"
+        return None
+
+
+def series(samples: dict, metric) -> list:
+    """Все значения метрики из TaskMetrics, по всем меткам"""
+    return [v for key, values in samples.items() if key.split("{")[0] == metric.name for v in values]
+
+
+async def run_scenario(browser, name, scenario, base_url, engine, llm_latency) -> dict:
+    errors = []
+
+    async def log(type, message):
+        if type == "error": errors.append(message)
+
+    agent = ScriptedAgent(browser, log, scenario["steps"], base_url, engine, llm_latency)
+    started = time.perf_counter()
+    await agent.execute_task(scenario["task"])
+    wall = time.perf_counter() - started
+    ok = bool(await browser.page.evaluate(scenario["check"]))
+
+    samples = agent.metrics.samples
+    snapshot_times = series(samples, SNAPSHOT_DURATION)
+    snapshot_sizes = series(samples, SNAPSHOT_SIZE)
+    return {
+        "ok": ok and not errors,
+        "wall_s": wall,
+        "steps": agent.iteration,
+        "step_ms": statistics.median(series(samples, ITERATION_DURATION) or [0]) * 1000,
+        "snapshot_ms": sum(snapshot_times) * 1000,
+        "snapshot_calls": len(snapshot_times),
+        "snapshot_chars": statistics.mean(snapshot_sizes) if snapshot_sizes else 0,
+        "settle_ms": sum(v for key, values in samples.items() if key == f"{SLEEP_DURATION.name}{{settle}}" for v in values) * 1000,
+        "errors": errors,
+    }
+
+
+async def run(names, engine, repeat, llm_latency, fast=False) -> dict:
+    scratch_journal()
+    server = serve_sites()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    browser = await BenchBrowser("", pool_size=1).start()
+    await browser.set_fast_mode(fast)
+    results = {}
+    try:
+        print(f"{'scenario':<10} {'ok':<4} {'wall s':>8} {'steps':>6} {'step ms':>9} {'snap ms':>9} {'snap chars':>11}")
+        for name in names:
+            runs = [await run_scenario(browser, name, SCENARIOS[name], base_url, engine, llm_latency)
+                    for _ in range(repeat)]
+            # Медиана по повторам; сценарий успешен, только если прошли все повторы
+            result = {key: round(statistics.median(r[key] for r in runs), 3) for key in COMPARED + ("steps", "snapshot_calls")}
+            result["ok"] = all(r["ok"] for r in runs)
+            result["errors"] = [e for r in runs for e in r["errors"]][:5]
+            results[name] = result
+            print(f"{name:<10} {'yes' if result['ok'] else 'NO':<4} {result['wall_s']:>8.2f} {result['steps']:>6.0f} "
+                  f"{result['step_ms']:>9.1f} {result['snapshot_ms']:>9.1f} {result['snapshot_chars']:>11.0f}")
+    finally:
+        await browser.stop()
+        server.shutdown()
+    return {"created": time.strftime("%Y-%m-%d %H:%M:%S"), "engine": engine, "repeat": repeat,
+            "llm_latency": llm_latency, "fast": fast, "scenarios": results}
+
+
+def compare(old: dict, new: dict, threshold: float) -> list:
+    """Регрессии new относительно old: провал сценария или рост метрики больше порога"""
+    regressions = []
+    print(f"{'scenario':<10} {'metric':<15} {'old':>10} {'new':>10} {'change':>8}")
+    for name, after in new["scenarios"].items():
+        before = old["scenarios"].get(name)
+        if not before: continue
+        if before["ok"] and not after["ok"]:
+            regressions.append(f"{name}: сценарий перестал проходить")
+        for metric in COMPARED:
+            a, b = before.get(metric), after.get(metric)
+            if not a or b is None: continue
+            change = (b - a) / a
+            flag = change > threshold
+            print(f"{name:<10} {metric:<15} {a:>10.1f} {b:>10.1f} {change:>+7.0%}{' !!' if flag else ''}")
+            if flag: regressions.append(f"{name}: {metric} {a:.1f} -> {b:.1f} ({change:+.0%})")
+    return regressions
+
+
+def load(path: str) -> dict:
+    with open(path, encoding="utf-8") as f: return json.load(f)
+
+
+def report(regressions: list) -> int:
+    for line in regressions: print(f"!! {line}")
+    print("Регрессий нет" if not regressions else f"Регрессий: {len(regressions)}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--engine", default=SNAPSHOT_ENGINE, choices=sorted(ENGINES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="имитация задержки модели, сек")
+    parser.add_argument("--fast", action="store_true", help="быстрый режим: блокировка картинок, шрифтов и трекеров")
+    parser.add_argument("--out", default="bench_e2e.json")
+    parser.add_argument("--baseline", help="сравнить новый прогон с этим файлом")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="только сравнить два файла результатов")
+    parser.add_argument("--threshold", type=float, default=0.15, help="допустимый рост метрики (0.15 = +15%%)")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(report(compare(load(args.compare[0]), load(args.compare[1]), args.threshold)))
+
+    results = asyncio.run(run(args.scenarios, args.engine, args.repeat, args.llm_latency, args.fast))
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Результаты: {args.out}")
+    failed = [name for name, r in results["scenarios"].items() if not r["ok"]]
+    code = 1 if failed else 0
+    if args.baseline:
+        code = report(compare(load(args.baseline), results, args.threshold)) or code
+    sys.exit(code)
@@ -0,0 +1,111 @@
+"""
+Нагрузочный тест очереди задач: фейковая модель и фейковые вкладки,
+реальные TaskQueue, пул вкладок BrowserController и цикл AIAgent.
+Показывает, как пропускная способность растет с размером пула.
+
+Запуск из корня проекта:
+    python -m benchmarks.load_test --tasks 24 --pools 1 2 4 8
+"""
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "load-test")
+
+from agent.ai_agent import AIAgent
+from agent.browser_controller import BrowserController
+from agent.task_queue import TaskQueue
+from benchmarks.e2e import ScratchStore, scratch_journal
+
+
+class FakePage:
+    url = "https://shop.example/"
+    main_frame = None
+
+    def is_closed(self): return False
+
+
+class FakeTab(BrowserController):
+    """Вкладка без браузера: действия просто занимают время"""
+
+    def __init__(self, action_latency: float):
+        super().__init__("", pool_size=0)
+        self.page = FakePage()
+        self.action_latency = action_latency
+
+    async def navigate(self, url):
+        await asyncio.sleep(self.action_latency)
+        return {"success": True, "url": url}
+
+    async def click(self, selector):
+        await asyncio.sleep(self.action_latency)
+        return {"success": True}
+
+
+class FakeBrowser(BrowserController):
+    def __init__(self, pool_size: int, action_latency: float):
+        super().__init__("", pool_size=pool_size)
+        self.action_latency = action_latency
+
+    async def start(self):
+        self._tabs, self._idle_tabs = [], asyncio.Queue()
+        return self
+
+    async def _open_tab(self):
+        return FakeTab(self.action_latency)
+
+
+class FakeLLMAgent(AIAgent):
+    """Сценарий из нескольких шагов вместо настоящей модели"""
+    llm_latency = 0.2
+    steps = 4
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Без повтора траекторий: иначе следующие серии обходили бы "модель"
+        self.trajectories = ScratchStore()
+
+    async def _call_llm_with_fallback(self, history, **stream):
+        await asyncio.sleep(self.llm_latency)
+        done = sum(1 for m in history if m.get("role") == "tool")
+        if done == 0:
+            return {"content": "", "tool_calls": [{"id": "nav", "name": "navigate", "args": {"url": "shop.example"}}]}
+        if done < self.steps:
+            return {"content": "", "tool_calls": [{"id": f"c{done}", "name": "click", "args": {"selector": "[1]"}}]}
+        return {"content": "", "tool_calls": [{"id": "end", "name": "report_result", "args": {"result": "ok", "success": True}}]}
+
+
+async def noop_log(type, message):
+    pass
+
+
+async def run_pool(pool_size: int, n_tasks: int, action_latency: float) -> float:
+    browser = await FakeBrowser(pool_size, action_latency).start()
+    queue = TaskQueue(browser, concurrency=pool_size, agent_factory=FakeLLMAgent)
+    started = time.perf_counter()
+    for i in range(n_tasks):
+        queue.submit(f"task {i}", noop_log)
+    while queue.active():
+        await asyncio.sleep(0.01)
+    return time.perf_counter() - started
+
+
+async def main(args):
+    scratch_journal()
+    FakeLLMAgent.llm_latency = args.llm_latency
+    print(f"{'pool':>5} {'wall s':>8} {'tasks/s':>8} {'speedup':>8}")
+    base = None
+    for pool in args.pools:
+        wall = await run_pool(pool, args.tasks, args.action_latency)
+        base = base or wall
+        print(f"{pool:>5} {wall:>8.2f} {args.tasks / wall:>8.2f} {base / wall:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=24)
+    parser.add_argument("--pools", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--action-latency", type=float, default=0.05)
+    asyncio.run(main(parser.parse_args()))
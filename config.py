@@ -13,8 +13,95 @@ GOOGLE_MODEL = "gemini-2.5-flash-lite"  # Новейшая быстрая мод
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = "gpt-4o" 
 
-HEADLESS = False
+HEADLESS = os.getenv("HEADLESS", "False").lower() in ("true", "1", "yes")  # в Docker: HEADLESS=True
 USER_DATA_DIR = "./browser_session"
 VIEWPORT = {"width": 1280, "height": 900}
 
-DEBUG_MODE = True
\ No newline at end of file
+DEBUG_MODE = True
+# Стриминг ответов модели: мысли идут в панель по мере генерации,
+# а инструменты запускаются сразу после разбора каждого вызова
+LLM_STREAMING = True
+
+# Ожидание "страница успокоилась" после действий (вместо фиксированных пауз)
+SETTLE_MAX_WAIT = 3.0           # верхняя граница ожидания, сек (прежние фиксированные паузы - до 2.5)
+SETTLE_DOM_QUIET_MS = 300       # окно проверки "DOM спокоен", мс
+SETTLE_DOM_MAX_MUTATIONS = 3    # допустимо изменений за окно (кроме style/class): таймеры, тикеры
+SETTLE_NETWORK_QUIET_MS = 500   # сеть простаивает столько мс подряд
+SETTLE_MAX_INFLIGHT = 2         # допустимое число висящих запросов (аналитика, long-poll)
+
+# Движок снимка страницы: "index" - постоянный индекс с инкрементальным
+# обновлением, "fast" - оптимизированный полный обход, "legacy" - исходный обход,
+# "ax" - дерево доступности Chromium через CDP (без page.evaluate).
+# "index" и "fast" еще не сверены с legacy в настоящем Chromium (benchmarks/bench_snapshot.py)
+SNAPSHOT_ENGINE = "legacy"
+# Дельта длиннее этой доли полного снимка заменяется полным снимком
+SNAPSHOT_DELTA_MAX_RATIO = 0.6
+# Бюджет токенов на полный снимок по умолчанию (0 - без ограничения)
+SNAPSHOT_TOKEN_BUDGET = 6000
+
+# Сколько задач выполняется одновременно (по одной вкладке на задачу)
+MAX_CONCURRENT_TASKS = 3
+
+# Задержка между нажатиями при посимвольном вводе (если сайт отверг быстрый fill)
+TYPE_DELAY_MS = 100
+
+# Бюджет промпта в токенах: история сжимается, старые шаги уходят в сводку
+MAX_PROMPT_TOKENS = 32000
+# При переполнении история сжимается до этой доли бюджета, а не впритык:
+# сводка и шаги потом не меняются несколько ходов (кэш префикса у провайдера)
+HISTORY_COMPACT_TARGET = 0.65
+
+# Явный кэш префикса промпта в Gemini (системный промпт + инструменты + задача)
+GEMINI_CONTEXT_CACHE = True
+GEMINI_CACHE_TTL = 900  # сек
+
+# Маршрутизация между провайдерами LLM (хедж-запросы + circuit breaker)
+ROUTER_WINDOW = 20              # размер скользящего окна статистики
+ROUTER_HEDGE_DELAY = 12.0       # через сколько сек без ответа слать запрос запасному
+ROUTER_HEDGE_MIN_DELAY = 3.0    # нижняя граница порога хеджа (он следует за p95 задержки)
+ROUTER_FAILURE_THRESHOLD = 3    # ошибок подряд, чтобы разомкнуть предохранитель
+ROUTER_ERROR_RATE = 0.5         # или такая доля ошибок в окне
+ROUTER_COOLDOWN = 30.0          # сек до пробного запроса (half-open)
+
+# Запись успешных прогонов и их повтор без LLM для той же задачи на том же домене
+TRAJECTORY_REPLAY = True
+TRAJECTORY_FILE = "./trajectories.json"
+
+# Кассета запросов к LLM: "record" - сохранять ответы, "replay" - отдавать
+# сохраненные без сети, "" - выключено
+LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "")
+LLM_CASSETTE_DIR = "./cassettes"
+LLM_CASSETTE_LATENCY = False    # при воспроизведении выдерживать записанную задержку ответа
+
+# Быстрый режим: не грузить тяжелые ресурсы и трекеры (включается на задачу).
+# Цена: любой page.route отключает HTTP-кэш Playwright на вкладке, а перехваченные
+# запросы идут через обработчик на Python. Перехватываются только URL блокируемых
+# доменов и файлов с расширениями картинок/шрифтов/видео; картинки без расширения
+# (CDN с параметрами) грузятся как обычно. На сайтах, где повторные заходы берут
+# ресурсы из кэша, быстрый режим может оказаться медленнее - сверяйте e2e --fast
+FAST_MODE = False               # значение по умолчанию для задач без явного флага
+FAST_BLOCKED_TYPES = ("image", "media", "font")
+FAST_BLOCKED_DOMAINS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "googlesyndication.com",
+    "mc.yandex.ru", "top-fwz1.mail.ru", "facebook.net", "hotjar.com", "criteo.com", "adfox.ru",
+)
+
+# Снимок страницы после действия прикладывается к результату инструмента,
+# чтобы модели не тратить отдельный ход на get_page_content
+AUTO_SNAPSHOT = True
+AUTO_SNAPSHOT_TOOLS = ("navigate", "click", "press_key", "go_back", "scroll")
+
+# Доставка событий задач в панели (WebSocket)
+EVENT_HISTORY = 500         # событий на задачу хранится для догоняния после переподключения
+EVENT_QUEUE_SIZE = 1000     # очередь одного подключения; при переполнении старые события теряются
+EVENT_BATCH_WINDOW = 0.05   # окно склейки всплеска событий в одну пачку, сек
+EVENT_BATCH_MAX = 200       # событий в одной пачке
+EVENT_SEND_TIMEOUT = 10.0   # клиент, не принявший пачку за это время, отключается
+
+# Журнал прогонов: все шаги задач (SQLite в режиме WAL)
+JOURNAL_FILE = "./journal.db"
+
+# Подзадачи (spawn_agents): дочерние агенты на своих вкладках, параллельно
+SUBAGENT_CONCURRENCY = 3    # сколько дочерних агентов одной задачи работает одновременно
+SUBAGENT_MAX_STEPS = 20     # бюджет шагов дочернего агента по умолчанию
+SUBAGENT_MAX_TASKS = 8      # подзадач в одном вызове
@@ -7,6 +7,7 @@ const sendBtn = document.getElementById('send-btn');
 const stopBtn = document.getElementById('stop-btn');
 const pauseBtn = document.getElementById('pause-btn');
 const clearBtn = document.getElementById('clear-btn');
+const fastBtn = document.getElementById('fast-btn');
 const taskControls = document.getElementById('task-controls');
 const statusDot = document.getElementById('status-dot');
 const typing = document.getElementById('typing');
@@ -14,6 +15,10 @@ const welcome = document.getElementById('welcome');
 
 let isConnected = false;
 let isPaused = false;
+let liveThoughts = {}; // Пузыри мыслей по задачам, которые дописываются по мере стриминга
+let currentTaskId = null; // Задача, запущенная из этой панели (сервер ведет несколько)
+let lastSeq = {}; // Номер последнего показанного события по задачам - для догоняния после переподключения
+let fastMode = localStorage.getItem('fastMode') === '1'; // Блокировка тяжелых ресурсов для новых задач
 
 // Авто-ресайз
 input.addEventListener('input', function() {
@@ -30,6 +35,10 @@ function connect() {
         isConnected = true;
         statusDot.className = 'status-dot online';
         ws.send(JSON.stringify({command: "get_status"}));
+        // Догоняем события своей задачи, пропущенные, пока не было связи
+        if (currentTaskId) {
+            ws.send(JSON.stringify({command: "subscribe", task_id: currentTaskId, since: lastSeq[currentTaskId] || 0}));
+        }
     };
 
     ws.onclose = () => {
@@ -40,43 +49,77 @@ function connect() {
 
     ws.onmessage = (event) => {
         const data = JSON.parse(event.data);
-        
-        if (data.type === 'status') {
-            if (data.is_running) setBusyState();
-            else setIdleState();
-            isPaused = false;
-            updatePauseUI();
+
+        // События задач приходят пачками; повторы (после догоняния) пропускаем по seq
+        if (data.type === 'batch') {
+            if (data.dropped) addMsg('system', `⚠️ Пропущено событий: ${data.dropped}`, false);
+            for (const ev of data.events) {
+                if (ev.seq <= (lastSeq[ev.task_id] || 0)) continue;
+                lastSeq[ev.task_id] = ev.seq;
+                handleEvent(ev);
+            }
             return;
         }
+        handleEvent(data);
+    };
+}
 
-        // --- НОВОЕ: Обработка мыслей ---
-        if (data.type === 'thought') {
-            // Удаляем старые мысли, чтобы не захламлять? Или оставляем?
-            // Оставляем, как просил пользователь.
-            addMsg('thought', data.message, false); // false = не сохранять мысли в историю (опционально)
-        }
-        else if (data.type === 'tool') {
-            showTyping(true);
-            const friendlyText = formatToolLog(data.message);
-            addMsg('tool', friendlyText, true);
-        }
-        else if (data.type === 'success') {
+function handleEvent(data) {
+    if (data.type === 'task') {
+        currentTaskId = data.task_id;
+        return;
+    }
+
+    if (data.type === 'status') {
+        const mine = (data.tasks || []).find(t => t.task_id === currentTaskId)
+            || (data.tasks || []).filter(t => t.status === 'running' || t.status === 'queued').pop();
+        if (mine) currentTaskId = mine.task_id;
+        if (data.is_running) setBusyState();
+        else setIdleState();
+        isPaused = false;
+        updatePauseUI();
+        return;
+    }
+
+    // События чужих задач показываем, но состояние панели они не меняют
+    const foreign = data.task_id && currentTaskId && data.task_id !== currentTaskId;
+
+    // Стриминг мыслей: кусочки текста дописываем в пузырь своей задачи -
+    // у параллельных задач они не перемешиваются
+    const thoughtKey = data.task_id || '';
+    if (data.type === 'thought_delta') {
+        appendThought(thoughtKey, data.message);
+        return;
+    }
+    delete liveThoughts[thoughtKey];
+
+    // --- НОВОЕ: Обработка мыслей ---
+    if (data.type === 'thought') {
+        // Удаляем старые мысли, чтобы не захламлять? Или оставляем?
+        // Оставляем, как просил пользователь.
+        addMsg('thought', data.message, false); // false = не сохранять мысли в историю (опционально)
+    }
+    else if (data.type === 'tool') {
+        showTyping(true);
+        const friendlyText = formatToolLog(data.message);
+        addMsg('tool', friendlyText, true);
+    }
+    else if (data.type === 'success') {
+        showTyping(false);
+        const text = data.message.replace('Task completed', '').replace(/^{|}$/g, '').trim();
+        addMsg('ai', "✅ Готово! " + text, true);
+        if (!foreign) setIdleState();
+    }
+    else if (data.type === 'error') {
+        addMsg('error', data.message, true);
+        if (!foreign && !data.message.includes('Retrying')) {
             showTyping(false);
-            const text = data.message.replace('Task completed', '').replace(/^{|}$/g, '').trim();
-            addMsg('ai', "✅ Готово! " + text, true);
             setIdleState();
         }
-        else if (data.type === 'error') {
-            addMsg('error', data.message, true);
-            if (!data.message.includes('Retrying')) {
-                showTyping(false);
-                setIdleState();
-            }
-        }
-        else if (data.type === 'system') {
-            addMsg('system', data.message, true);
-        }
-    };
+    }
+    else if (data.type === 'system') {
+        addMsg('system', data.message, true);
+    }
 }
 
 connect();
@@ -88,7 +131,7 @@ function send() {
     if (welcome) welcome.style.display = 'none';
 
     addMsg('user', text, true);
-    ws.send(JSON.stringify({command: "start", task: text}));
+    ws.send(JSON.stringify({command: "start", task: text, fast: fastMode}));
     
     input.value = '';
     input.style.height = 'auto';
@@ -96,7 +139,7 @@ function send() {
 }
 
 function stop() {
-    ws.send(JSON.stringify({command: "stop"}));
+    ws.send(JSON.stringify({command: "stop", task_id: currentTaskId}));
     addMsg('error', "Остановлено", true);
     setIdleState();
 }
@@ -104,10 +147,10 @@ function stop() {
 function togglePause() {
     isPaused = !isPaused;
     if (isPaused) {
-        ws.send(JSON.stringify({command: "pause"}));
+        ws.send(JSON.stringify({command: "pause", task_id: currentTaskId}));
         addMsg('system', "⏸️ Пауза", true);
     } else {
-        ws.send(JSON.stringify({command: "resume"}));
+        ws.send(JSON.stringify({command: "resume", task_id: currentTaskId}));
         addMsg('system', "▶️ Продолжаю", true);
     }
     updatePauseUI();
@@ -180,6 +223,19 @@ function addMsg(type, text, save = false) {
     if (save) saveToStorage(type, text);
 }
 
+function appendThought(taskId, delta) {
+    if (welcome) welcome.style.display = 'none';
+    let bubble = liveThoughts[taskId];
+    if (!bubble) {
+        bubble = liveThoughts[taskId] = document.createElement('div');
+        bubble.className = 'msg msg-thought';
+        bubble.innerHTML = `<span style="opacity: 0.7;">🧠 Думаю:</span><br>`;
+        chat.appendChild(bubble);
+    }
+    bubble.appendChild(document.createTextNode(delta));
+    chat.scrollTop = chat.scrollHeight;
+}
+
 // --- Storage ---
 function saveToStorage(type, text) {
     // Мысли не сохраняем, чтобы не захламлять историю при перезагрузке
@@ -241,6 +297,17 @@ sendBtn.onclick = send;
 stopBtn.onclick = stop;
 pauseBtn.onclick = togglePause;
 
+function renderFastMode() {
+    fastBtn.classList.toggle('active', fastMode);
+}
+
+fastBtn.onclick = () => {
+    fastMode = !fastMode;
+    localStorage.setItem('fastMode', fastMode ? '1' : '0');
+    renderFastMode();
+};
+renderFastMode();
+
 input.addEventListener('keypress', (e) => {
     if (e.key === 'Enter' && !e.shiftKey) { e.preventDefault(); send(); }
 });
\ No newline at end of file
@@ -5,26 +5,33 @@ import asyncio
 import sys
 from rich.console import Console
 from rich.panel import Panel
-from rich.prompt import Prompt, Confirm
+from rich.prompt import Prompt
 
 from agent.browser_controller import BrowserController
-from agent.ai_agent import AIAgent
+from agent.ai_agent import AIAgent, reported_success
+from agent.providers import load as load_providers
 from config import HEADLESS, VIEWPORT, USER_DATA_DIR
 
 
 console = Console()
 
+EVENT_STYLES = {"thought": "italic dim", "tool": "cyan", "system": "dim", "error": "red"}
+streaming = False  # в консоли печатается мысль, которая еще стримится
 
-def handle_user_question(question: str) -> str:
-    """Обработчик вопросов от агента"""
-    console.print(f"\n[bold cyan]🤖 Agent needs your input:[/bold cyan]")
-    return Prompt.ask(f"   {question}")
 
-
-def handle_confirmation(action_description: str) -> bool:
-    """Обработчик запросов подтверждения (Security Layer)"""
-    console.print(f"\n[bold yellow]Action:[/bold yellow] {action_description}")
-    return Confirm.ask("[bold red]Do you approve this action?[/bold red]")
+async def print_event(type: str, message: str):
+    """События агента (log_callback) в консоль"""
+    global streaming
+    if type == "thought_delta":
+        console.print(message, end="", style="italic dim", markup=False, highlight=False)
+        streaming = True
+        return
+    if streaming:
+        console.print()
+        streaming = False
+    # Итог задачи печатается отдельной панелью, сводка метрик - для панели браузера
+    if type in ("success", "metrics"): return
+    console.print(message, style=EVENT_STYLES.get(type, ""), markup=False, highlight=False)
 
 
 async def main():
@@ -41,22 +48,18 @@ async def main():
     console.print(f"\n[dim]Session data stored in: {USER_DATA_DIR}[/dim]")
     console.print("[dim]Tip: Log into your accounts once, and the agent will remember[/dim]\n")
 
-    # Запуск браузера
+    # Запуск браузера; SDK провайдеров тем временем загружаются в отдельном потоке
     console.print("[yellow]Starting browser...[/yellow]")
     browser = BrowserController(
         user_data_dir=USER_DATA_DIR,
         headless=HEADLESS,
         viewport=VIEWPORT
     )
-    await browser.start()
+    await asyncio.gather(browser.start(), asyncio.to_thread(load_providers))
     console.print("[green]✓ Browser ready![/green]\n")
 
     # Создаём агента
-    agent = AIAgent(
-        browser,
-        on_user_question=handle_user_question,
-        on_confirmation=handle_confirmation
-    )
+    agent = AIAgent(browser, log_callback=print_event)
 
     try:
         while True:
@@ -88,9 +91,10 @@ async def main():
             console.print("[dim]Watch the browser window...[/dim]\n")
 
             try:
-                result = await agent.execute_task(task)
+                await agent.execute_task(task)
+                result = agent.result or {"success": False, "result": "Задача остановлена без результата"}
 
-                if result.get("success"):
+                if reported_success(result):
                     console.print(Panel(
                         f"[green]{result.get('result', 'Done')}[/green]",
                         title="✅ Task Completed",
@@ -1,76 +1,142 @@
 import asyncio
+import time
 import uvicorn
-from fastapi import FastAPI, WebSocket
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, HTTPException, WebSocket
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
 
 from agent.browser_controller import BrowserController
-from agent.ai_agent import AIAgent
-from config import USER_DATA_DIR, HEADLESS
+from agent.task_queue import TaskQueue
+from agent.trajectory import TRAJECTORIES
+from agent.metrics import render_prometheus
+from agent.events import Subscriber
+from agent.journal import JOURNAL
+from agent.providers import load as load_providers, status as provider_status
+from config import USER_DATA_DIR, HEADLESS, MAX_CONCURRENT_TASKS
 
 app = FastAPI()
 
 # Глобальное состояние
 browser = None
-current_agent = None
+tasks = None
+browser_ready = None  # попытка запуска браузера завершена (успешно или нет)
+warmup = {"task": None, "browser_ms": None, "error": None}
 
 @app.on_event("startup")
 async def startup_event():
-    global browser
-    # Инициализируем браузер один раз при старте сервера
-    browser = BrowserController(user_data_dir=USER_DATA_DIR, headless=HEADLESS)
-    await browser.start()
-    print("Browser started and ready")
+    global browser, tasks, browser_ready
+    # Сервер принимает подключения сразу; браузер и SDK провайдеров греются в фоне,
+    # а задачи, поставленные до готовности браузера, ждут в очереди
+    browser = BrowserController(user_data_dir=USER_DATA_DIR, headless=HEADLESS, pool_size=MAX_CONCURRENT_TASKS)
+    browser_ready = asyncio.Event()
+    tasks = TaskQueue(browser, concurrency=MAX_CONCURRENT_TASKS, ready=browser_ready)
+    warmup["task"] = asyncio.create_task(warm_up())
+
+async def warm_up():
+    providers = asyncio.create_task(asyncio.to_thread(load_providers))
+    started = time.monotonic()
+    try:
+        await browser.start()
+        warmup["browser_ms"] = int((time.monotonic() - started) * 1000)
+        print(f"Browser started and ready ({warmup['browser_ms']} ms)")
+    except Exception as e:
+        warmup["error"] = str(e)
+        print(f"Browser failed to start: {e}")
+    finally:
+        browser_ready.set()
+    try: await providers
+    except Exception as e: print(f"Provider SDK preload failed: {e}")
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    if warmup["task"] and not warmup["task"].done():
+        warmup["task"].cancel()
     if browser:
         await browser.stop()
+    JOURNAL.close()
+
+@app.get("/ready")
+async def ready():
+    """Готовность к задачам: браузер запущен и SDK провайдера загружен (иначе 503)"""
+    browser_up = browser_ready is not None and browser_ready.is_set() and not warmup["error"]
+    llm = provider_status()
+    body = {
+        "ready": browser_up and llm["ready"],
+        "browser": {"ready": browser_up, "startup_ms": warmup["browser_ms"], "error": warmup["error"]},
+        "providers": llm,
+    }
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Гистограммы времени шагов в формате Prometheus"""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/replay/stats")
+async def replay_stats():
+    """Доля задач, найденных среди записанных сценариев, и сэкономленное время"""
+    return TRAJECTORIES.stats()
+
+@app.get("/runs")
+async def list_runs(offset: int = 0, limit: int = 50):
+    """Журнал прогонов, новые сверху"""
+    return await asyncio.to_thread(JOURNAL.runs, max(offset, 0), min(max(limit, 1), 500))
+
+@app.get("/runs/{run_id}/steps")
+async def run_steps(run_id: str, offset: int = 0, limit: int = 100):
+    """Шаги одного прогона по порядку"""
+    page = await asyncio.to_thread(JOURNAL.steps, run_id, max(offset, 0), min(max(limit, 1), 500))
+    if page is None: raise HTTPException(status_code=404, detail="Run not found")
+    return page
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    global current_agent
-    
-    async def log_to_web(type: str, message: str):
-        try: await websocket.send_json({"type": type, "message": message})
+
+    # Все события задач идут через шины задач; это подключение - один из подписчиков
+    client = Subscriber(websocket.send_json)
+
+    async def reply(type: str, message: str, task_id: str = None):
+        try: await websocket.send_json({"type": type, "message": message, "task_id": task_id})
         except: pass
 
-    if current_agent and current_agent.running:
-        current_agent.log = log_to_web
+    # Переподключившаяся панель получает новые события активных задач;
+    # пропущенные она догоняет командой subscribe с номером последнего события
+    for task in tasks.active():
+        client.follow(task.events)
 
     try:
         while True:
             data = await websocket.receive_json()
             command = data.get("command")
+            task_id = data.get("task_id")
             
             if command == "get_status":
-                is_running = current_agent is not None and current_agent.running
-                await websocket.send_json({"type": "status", "is_running": is_running})
+                await websocket.send_json({"type": "status", **tasks.status()})
 
             elif command == "start":
-                task = data.get("task")
-                if current_agent and current_agent.running:
-                    await log_to_web("error", "Задача уже выполняется!")
-                    continue
-                current_agent = AIAgent(browser, log_callback=log_to_web)
-                asyncio.create_task(current_agent.execute_task(task))
+                task = tasks.submit(data.get("task"), fast=data.get("fast"))
+                client.follow(task.events)
+                await websocket.send_json({"type": "task", **task.to_dict()})
+
+            elif command == "subscribe":
+                task = tasks.get(task_id)
+                if task: client.follow(task.events, since=int(data.get("since") or 0))
+                else: await reply("error", "Задача не найдена", task_id)
                 
             elif command == "stop":
-                if current_agent:
-                    current_agent.running = False
-                    await log_to_web("error", "Остановлено пользователем")
+                task = tasks.stop(task_id)
+                if task: await task.log("error", "Остановлено пользователем")
 
-            # --- НОВЫЕ КОМАНДЫ ---
             elif command == "pause":
-                if current_agent:
-                    current_agent.paused = True
+                tasks.pause(task_id, True)
             
             elif command == "resume":
-                if current_agent:
-                    current_agent.paused = False
+                tasks.pause(task_id, False)
 
     except Exception as e:
         print(f"WebSocket disconnected: {e}")
+    finally:
+        client.close()
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="127.0.0.1", port=8000)
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def isolated_state(tmp_path, monkeypatch):
+    """Журнал во временной папке, без повтора записанных траекторий"""
+    from agent import ai_agent
+    from agent.journal import JOURNAL
+    monkeypatch.setattr(JOURNAL, "path", str(tmp_path / "journal.db"))
+    monkeypatch.setattr(ai_agent, "TRAJECTORY_REPLAY", False)
+    yield
+    JOURNAL.close()
@@ -0,0 +1,45 @@
+"""
+Заглушки браузера для тестов: вкладки без Chromium, действия мгновенные
+"""
+import asyncio
+
+from agent.browser_controller import BrowserController
+
+
+class FakePage:
+    url = "https://shop.example/"
+    main_frame = None
+
+    def is_closed(self): return False
+
+
+class FakeTab(BrowserController):
+    """Вкладка без браузера: действия сразу успешны"""
+
+    def __init__(self, page=None):
+        super().__init__("", pool_size=0)
+        self.page = page or FakePage()
+
+    async def navigate(self, url):
+        return {"success": True, "url": url}
+
+    async def click(self, selector):
+        return {"success": True}
+
+
+class FakeBrowser(BrowserController):
+    """Пул из FakeTab вместо запуска Chromium"""
+
+    def __init__(self, pool_size: int):
+        super().__init__("", pool_size=pool_size)
+
+    async def start(self):
+        self._tabs, self._idle_tabs = [], asyncio.Queue()
+        return self
+
+    async def _open_tab(self):
+        return FakeTab()
+
+
+async def noop_log(type, message):
+    pass
@@ -0,0 +1,35 @@
+"""
+Ключ кассеты не зависит от таймингов в результатах инструментов,
+в том числе вложенных (run_actions, spawn_agents).
+"""
+import json
+
+from agent.cassette import Cassette
+
+
+def history(settle_ms: int, input_ms: int, duration_ms: int):
+    batch = {"success": True, "completed": 2, "results": [
+        {"tool": "type_text", "success": True, "strategy": "fill", "input_ms": input_ms, "settle_ms": settle_ms},
+        {"tool": "click", "success": True, "settle_ms": settle_ms, "settle_timeout": False},
+    ]}
+    fanout = {"success": True, "duration_ms": duration_ms,
+              "results": [{"task": "a", "success": True, "steps": 3, "duration_ms": duration_ms}]}
+    return [
+        {"role": "user", "content": "Task"},
+        {"role": "assistant", "content": "", "tool_calls": [
+            {"id": "uuid-1", "name": "run_actions", "args": {}}, {"id": "uuid-2", "name": "spawn_agents", "args": {}}]},
+        {"role": "tool", "tool_call_id": "uuid-1", "name": "run_actions", "content": json.dumps(batch)},
+        {"role": "tool", "tool_call_id": "uuid-2", "name": "spawn_agents", "content": json.dumps(fanout)},
+    ]
+
+
+def test_nested_timings_do_not_change_key(tmp_path):
+    cassette = Cassette("replay", str(tmp_path))
+    assert cassette.key(history(100, 5, 1200)) == cassette.key(history(250, 40, 3400))
+
+
+def test_results_still_change_key(tmp_path):
+    cassette = Cassette("replay", str(tmp_path))
+    changed = history(100, 5, 1200)
+    changed[2]["content"] = changed[2]["content"].replace('"completed": 2', '"completed": 1')
+    assert cassette.key(history(100, 5, 1200)) != cassette.key(changed)
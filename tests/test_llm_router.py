@@ -0,0 +1,47 @@
+"""
+Хедж-запросы маршрутизатора: запасной провайдер запускается, только пока
+основной молчит.
+"""
+import asyncio
+
+import pytest
+
+from agent import llm_router
+from agent.llm_router import LLMRouter
+
+
+def provider(name, calls, first_event: float, total: float):
+    async def call(history, on_text, on_tool_call):
+        calls.append(name)
+        await asyncio.sleep(first_event)
+        if on_text: await on_text(name)
+        await asyncio.sleep(total - first_event)
+        return {"content": name}
+    return call
+
+
+async def route(calls, primary, backup) -> dict:
+    router = LLMRouter({"primary": primary, "backup": backup}, ["primary", "backup"], stats={})
+
+    async def on_text(delta): pass
+    return await router.call([], on_text=on_text)
+
+
+@pytest.fixture(autouse=True)
+def short_hedge(monkeypatch):
+    monkeypatch.setattr(llm_router, "ROUTER_HEDGE_DELAY", 0.2)
+
+
+def test_no_hedge_once_primary_streams():
+    # Первый токен до порога хеджа, полный ответ - после: запасной не нужен
+    calls = []
+    result = asyncio.run(route(calls, provider("primary", calls, 0.05, 0.5), provider("backup", calls, 0.05, 0.1)))
+    assert result == {"content": "primary"}
+    assert calls == ["primary"]
+
+
+def test_hedge_when_primary_is_silent():
+    calls = []
+    result = asyncio.run(route(calls, provider("primary", calls, 1.0, 1.0), provider("backup", calls, 0.05, 0.1)))
+    assert result == {"content": "backup"}
+    assert calls == ["primary", "backup"]
@@ -0,0 +1,83 @@
+"""
+Стабильность префикса промпта для кэша провайдера: локальная замена
+клиента Gemini записывает запросы нескольких ходов задачи.
+"""
+import asyncio
+
+import pytest
+from google.genai import types
+
+from agent import ai_agent
+from agent.ai_agent import AIAgent, SYSTEM_INSTRUCTION
+from tests.fakes import FakeTab, noop_log
+
+USAGE = {"prompt_token_count": 1200, "cached_content_token_count": 800, "candidates_token_count": 20}
+
+
+class FakeGemini:
+    """Клиент Gemini без сети: отвечает сценарием, кэш контекста недоступен"""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.requests = []
+        self.cache_attempts = 0
+        self.aio = self
+        self.models = self
+        self.caches = self
+
+    async def create(self, model, config):
+        self.cache_attempts += 1
+        raise RuntimeError("Cached content is too small")
+
+    def _response(self, contents, config):
+        self.requests.append((contents, config))
+        part = self.script.pop(0)
+        return types.GenerateContentResponse(
+            candidates=[types.Candidate(content=types.Content(role="model", parts=[part]))],
+            usage_metadata=types.GenerateContentResponseUsageMetadata(**USAGE))
+
+    async def generate_content(self, model, contents, config):
+        return self._response(contents, config)
+
+    async def generate_content_stream(self, model, contents, config):
+        response = self._response(contents, config)
+
+        async def chunks():
+            yield response
+        return chunks()
+
+
+def call(name, **args):
+    return types.Part(function_call=types.FunctionCall(name=name, args=args))
+
+
+@pytest.mark.parametrize("streaming", [True, False])
+def test_prefix_is_stable_and_usage_is_summed(monkeypatch, streaming):
+    monkeypatch.setattr(ai_agent, "LLM_STREAMING", streaming)
+    monkeypatch.setattr(ai_agent, "GEMINI_CONTEXT_CACHE", True)
+    gemini = FakeGemini([
+        call("save_finding", finding="Цена 100"),
+        call("save_finding", finding="Цена 200"),
+        call("report_result", result="Готово", success=True),
+    ])
+    agent = AIAgent(FakeTab(), log_callback=noop_log)
+    agent._gemini = gemini
+    asyncio.run(agent.execute_task("Сравни цены"))
+
+    assert agent.result["result"] == "Готово"
+    assert len(gemini.requests) == 3
+    # Кэш создать не удалось: пробуем один раз и дальше идем без него
+    assert gemini.cache_attempts == 1
+    assert agent._gemini_cache is None  # сброшен после задачи
+
+    first_contents, first_config = gemini.requests[0]
+    for contents, config in gemini.requests:
+        assert config.cached_content is None
+        assert config.system_instruction == SYSTEM_INSTRUCTION
+        assert [t.model_dump_json() for t in config.tools] == [t.model_dump_json() for t in first_config.tools]
+        assert contents[0].model_dump_json() == first_contents[0].model_dump_json()
+        # История только дописывается: закодированные сообщения прошлых ходов те же
+        assert contents[:len(first_contents)] == first_contents
+    assert gemini.requests[-1][0][0].parts[0].text.startswith("Task: Сравни цены")
+
+    assert agent.token_usage["gemini"] == {"calls": 3, "prompt": 3600, "cached": 2400, "output": 60}
@@ -0,0 +1,78 @@
+"""
+Повтор записанной траектории: расхождение и полный повтор отдают
+управление модели, итог задачи - по текущей странице, а не из записи.
+"""
+import asyncio
+
+import pytest
+
+from agent import ai_agent
+from agent.ai_agent import AIAgent
+from agent.trajectory import TrajectoryStore
+from tests.fakes import FakePage, FakeTab, noop_log
+
+TASK = "Проверь статус заказа"
+STEPS = [
+    {"tool": "click", "args": {"selector": "[5]"}, "fingerprint": {"tag": "a", "text": "Заказы"}, "domain": "shop.example"},
+    {"tool": "click", "args": {"selector": "[9]"}, "fingerprint": {"tag": "a", "text": "Заказ 42"}, "domain": "shop.example"},
+]
+
+
+class ReplayPage(FakePage):
+    def __init__(self, error=None):
+        self.error = error
+        self.lookups = 0
+
+    async def evaluate(self, script, arg=None):
+        self.lookups += 1
+        if self.error: raise self.error
+        return "r1"
+
+
+class ScriptedAgent(AIAgent):
+    """Модель сразу дает итог по странице"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prompts = []
+
+    async def _call_llm_with_fallback(self, history, **stream):
+        self.prompts.append(history[0]["content"])
+        return {"content": "", "tool_calls": [{"id": "end", "name": "report_result", "args": {"result": "Доставлен", "success": True}}]}
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(ai_agent, "TRAJECTORY_REPLAY", True)
+    store = TrajectoryStore(str(tmp_path / "trajectories.json"))
+    store.save(TASK, "shop.example", STEPS, 30.0, "В пути")
+    return store
+
+
+def run(page, store) -> ScriptedAgent:
+    agent = ScriptedAgent(FakeTab(page), log_callback=noop_log)
+    agent.trajectories = store
+    asyncio.run(agent.execute_task(TASK))
+    return agent
+
+
+def test_lookup_error_falls_back_to_llm(store):
+    page = ReplayPage(RuntimeError("Execution context was destroyed"))
+    agent = run(page, store)
+
+    assert page.lookups == 1
+    assert store.stats()["diverged"] == 1
+    assert len(agent.prompts) == 1 and "diverged: element lookup failed" in agent.prompts[0]
+    assert agent.result["result"] == "Доставлен"
+
+
+def test_completed_replay_is_verified_by_llm(store):
+    recorded = dict(store.find(TASK, "shop.example"))
+    agent = run(ReplayPage(), store)
+
+    assert store.stats()["completed"] == 1
+    # Один ход модели вместо всего сценария, итог - свежий, а не записанный "В пути"
+    assert len(agent.prompts) == 1 and "Verify the current page" in agent.prompts[0]
+    assert agent.result == {"result": "Доставлен", "success": True}
+    # Модель ничего не добавила - записанная траектория не перезаписана
+    assert store.find(TASK, "shop.example") == recorded
@@ -0,0 +1,81 @@
+"""
+Медленная модель не должна задерживать остальной трафик WebSocket:
+пока задача ждет ответа LLM, get_status и stop отвечают сразу.
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+from agent.ai_agent import AIAgent
+from tests.fakes import FakeBrowser
+
+
+LLM_CALLS = []
+
+
+async def hanging_gemini(self, history, on_text=None, on_tool_call=None):
+    LLM_CALLS.append(history)
+    await asyncio.sleep(30)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(AIAgent, "_call_gemini", hanging_gemini)
+    monkeypatch.setattr(server, "BrowserController", lambda user_data_dir, headless, pool_size: FakeBrowser(pool_size))
+    with TestClient(server.app) as client:
+        yield client
+
+
+def receive_json(ws, timeout: float) -> dict:
+    """ws.receive_json() с таймаутом: чтение в фоновом потоке, чтобы зависание
+    сервера роняло тест, а не весь прогон"""
+    box = {}
+
+    def read():
+        try: box["data"] = ws.receive_json()
+        except Exception as e: box["error"] = e
+
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    reader.join(timeout)
+    if "error" in box: raise box["error"]
+    if "data" not in box: raise AssertionError(f"no message within {timeout} s")
+    return box["data"]
+
+
+def receive(ws, match, timeout=2.0):
+    """Первое сообщение (или событие из пачки), для которого match(...) истинно"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        data = receive_json(ws, deadline - time.monotonic())
+        for item in data["events"] if data["type"] == "batch" else [data]:
+            if match(item): return item
+    raise AssertionError("no matching message")
+
+
+def test_slow_llm_does_not_block_websocket(client):
+    with client.websocket_connect("/ws") as ws:
+        ws.send_json({"command": "start", "task": "Найди товар"})
+        task_id = receive(ws, lambda m: m["type"] == "task")["task_id"]
+        # Агент уже ждет модель
+        receive(ws, lambda m: m["type"] == "system" and m["task_id"] == task_id)
+
+        started = time.monotonic()
+        ws.send_json({"command": "get_status"})
+        status = receive(ws, lambda m: m["type"] == "status")
+        assert time.monotonic() - started < 1.0
+        assert [t["status"] for t in status["tasks"]] == ["running"]
+        assert LLM_CALLS  # ответ модели все еще ждут
+
+        started = time.monotonic()
+        ws.send_json({"command": "stop", "task_id": task_id})
+        receive(ws, lambda m: m["type"] == "error" and "Остановлено" in m["message"])
+        assert time.monotonic() - started < 1.0
+
+        ws.send_json({"command": "get_status"})
+        status = receive(ws, lambda m: m["type"] == "status")
+        assert [t["status"] for t in status["tasks"]] == ["stopped"]
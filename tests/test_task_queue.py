@@ -0,0 +1,37 @@
+"""
+Статус задачи в очереди совпадает с итогом report_result агента.
+"""
+import asyncio
+
+import pytest
+
+from agent.ai_agent import AIAgent
+from agent.task_queue import TaskQueue
+from tests.fakes import FakeBrowser, noop_log
+
+
+def reporting(success: bool):
+    class Agent(AIAgent):
+        async def _call_llm_with_fallback(self, history, **stream):
+            return {"content": "", "tool_calls": [{"id": "end", "name": "report_result",
+                                                   "args": {"result": "Итог", "success": success}}]}
+    return Agent
+
+
+async def finish(success: bool):
+    queue = TaskQueue(await FakeBrowser(1).start(), concurrency=1, agent_factory=reporting(success))
+    task = queue.submit("Задача", noop_log)
+    while queue.active(): await asyncio.sleep(0.01)
+    return queue, task
+
+
+@pytest.mark.parametrize("success, status", [(True, "done"), (False, "failed")])
+def test_status_follows_report_result(success, status):
+    _, task = asyncio.run(finish(success))
+    assert task.status == status
+
+
+def test_stop_of_finished_task_is_noop():
+    queue, task = asyncio.run(finish(True))
+    assert queue.stop(task.id) is None
+    assert task.status == "done"